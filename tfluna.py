@@ -0,0 +1,255 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- command-line tool: read, stream, config, record,
+# --- plot and bench. NumPy and Matplotlib are only
+# --- imported by the subcommands that use them, so a
+# --- one-shot read starts in a few tens of ms
+#
+#
+######################################################
+#
+# python3 tfluna.py read                      one reading
+# python3 tfluna.py stream --rate 250         CSV until Ctrl+C
+# python3 tfluna.py config --detect --set-baud 115200 --rate 100
+# python3 tfluna.py record capture.bin --duration 60
+# python3 tfluna.py plot [--png dash.png | --realtime | --samples 100]
+# python3 tfluna.py bench decoder
+#
+import argparse,sys,time
+#
+############################
+# Helpers
+############################
+#
+def open_lidar(args):
+    ##########################
+    # open the port and apply the common sensor options in order:
+    # --detect, --set-baud, --rate (exits with a message on failure)
+    from tfluna_driver import TFLuna
+    lidar = TFLuna(args.port,args.baud).open()
+    if args.detect:
+        baudrate = lidar.detect_baudrate()
+        if baudrate is None:
+            lidar.close()
+            sys.exit('No TF-Luna answered on {0}'.format(args.port))
+        print('Detected Baud Rate = {0}'.format(baudrate),file=sys.stderr)
+    if args.set_baud is not None:
+        if lidar.set_baudrate(args.set_baud) is None:
+            lidar.close()
+            sys.exit('Baud rate change to {0} not confirmed'.format(args.set_baud))
+        print('Baud Rate = {0}'.format(args.set_baud),file=sys.stderr)
+    if args.rate is not None:
+        if lidar.set_sample_rate(args.rate) is None:
+            lidar.close()
+            sys.exit('Sample rate change to {0} Hz not confirmed'.format(args.rate))
+    return lidar
+
+def sample_count(text):
+    ##########################
+    # argparse type of --samples: a sample rate needs two samples
+    value = int(text)
+    if value<2:
+        raise argparse.ArgumentTypeError('need at least 2 samples, got {0}'.format(value))
+    return value
+
+def format_frame(distance,strength,temperature):
+    return 'Distance: {0:2.2f} m, Strength: {1:2.0f} / 65535 (16-bit), Chip Temperature: {2:2.1f} C'.\
+           format(distance,strength,temperature)
+#
+############################
+# Subcommands
+############################
+#
+def cmd_read(args):
+    ##########################
+    # print --count readings as soon as they arrive
+    lidar = open_lidar(args)
+    try:
+        for _ in range(args.count):
+            frame = lidar.read()
+            if frame is None:
+                sys.exit('No data from {0} (wrong baud rate? try --detect)'.format(args.port))
+            print(format_frame(*frame))
+    finally:
+        lidar.close()
+
+def cmd_stream(args):
+    ##########################
+    # CSV (time [s] on the monotonic clock,distance,strength,temperature)
+    # to stdout until Ctrl+C or --duration
+    lidar = open_lidar(args)
+    t_end = None if args.duration is None else time.monotonic()+args.duration
+    out = sys.stdout
+    try:
+        out.write('time,distance,strength,temperature\n')
+        while t_end is None or time.monotonic()<t_end:
+            frames = lidar.read_many(stamped=True)
+            out.write(''.join('{0:.6f},{1:.2f},{2:d},{3:.1f}\n'.format(t_ns*1e-9,d,s,temp)
+                              for t_ns,d,s,temp in frames))
+            out.flush()
+    except (KeyboardInterrupt,BrokenPipeError):
+        pass
+    finally:
+        lidar.close()
+
+def cmd_config(args):
+    ##########################
+    # one-off configuration (the common options do the baud/sample rate)
+    lidar = open_lidar(args)
+    try:
+        if args.trigger:
+            print('Trigger Mode = {0}'.format(lidar.set_trigger_mode()))
+        if args.standard_format:
+            from tfluna_commands import FORMAT_STANDARD_CM # the only format the decoder reads
+            print('Output Format = {0}'.format(lidar.set_output_format(FORMAT_STANDARD_CM)))
+        if args.factory_reset:
+            print('Factory Reset = {0}'.format(lidar.factory_reset()))
+        if args.save:
+            print('Settings Saved = {0}'.format(lidar.save_settings()))
+        print('Version -{0}'.format(lidar.version())) # print version info for TF-Luna
+        if args.check:
+            n_frames,t0 = 0,time.monotonic()
+            while n_frames<args.check:
+                frames = lidar.read_many()
+                if not frames: # timeout: trigger mode or the output stopped
+                    sys.exit('No data from {0} after {1} frames'.format(args.port,n_frames))
+                n_frames += len(frames)
+            print('Sample Rate: {0:2.0f} Hz'.format(n_frames/(time.monotonic()-t0)))
+            stats = lidar.metrics_snapshot()
+            print('Checksum Errors: {0}, Bytes Discarded: {1}, Buffer Overruns: {2}'.format(
+                stats['checksum_errors'],stats['bytes_discarded'],stats['buffer_overruns']))
+    finally:
+        lidar.close()
+
+def cmd_record(args):
+    ##########################
+    # append frames to a recording (tfluna_record format) with wall-clock
+    # timestamps derived from the per-frame monotonic stamps
+    from tfluna_record import Recorder
+    lidar = open_lidar(args)
+    wall_offset = time.time()-time.monotonic() # monotonic -> epoch [s]
+    t_end = None if args.duration is None else time.monotonic()+args.duration
+    n_frames = 0
+    try:
+        with Recorder(args.path,samp_rate=lidar.samp_rate or 0.0) as recorder:
+            while t_end is None or time.monotonic()<t_end:
+                for t_ns,distance,strength,temperature in lidar.read_many(stamped=True):
+                    recorder.append(distance,strength,temperature,t_ns*1e-9+wall_offset)
+                    n_frames += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lidar.close()
+    print('Recorded {0} frames to {1}'.format(n_frames,args.path),file=sys.stderr)
+
+def cmd_plot(args):
+    ##########################
+    # --samples N: ranging test plot of N samples; --realtime: blitted
+    # plot of the last 100 samples; otherwise the long-history dashboard
+    lidar = open_lidar(args)
+    try:
+        if args.samples:
+            time_array,dist_array = [],[]
+            while len(dist_array)<args.samples:
+                frames = lidar.read_many(stamped=True)
+                if not frames: # timeout: trigger mode or the output stopped
+                    sys.exit('No data from {0} after {1} samples'.format(args.port,len(dist_array)))
+                for t_ns,distance,strength,temperature in frames:
+                    time_array.append(t_ns*1e-9) # sample time [s], stamped on arrival
+                    dist_array.append(distance)
+            lidar.close()
+            print('Sample Rate: {0:2.0f} Hz'.format((len(dist_array)-1)/(time_array[-1]-time_array[0])))
+            import matplotlib.pyplot as plt
+            plt.style.use('ggplot') # figure formatting
+            fig,ax = plt.subplots(figsize=(12,9)) # figure and axis
+            ax.plot([t-time_array[0] for t in time_array],dist_array,linewidth=3.5) # plot ranging data
+            ax.set_ylabel('Distance [m]',fontsize=16)
+            ax.set_xlabel('Time [s]',fontsize=16)
+            ax.set_title('TF-Luna Ranging Test',fontsize=18)
+            plt.show() # show figure
+        elif args.realtime:
+            from tfluna_realtime import run_realtime
+            if args.interval:
+                run_realtime(lidar,render_fps=1.0/args.interval)
+            else:
+                run_realtime(lidar)
+        else:
+            from tfluna_dashboard import run_dashboard
+            run_dashboard(lidar,args.window,args.png,args.interval)
+    finally:
+        lidar.close()
+
+def cmd_bench(args):
+    import tfluna_bench
+    tfluna_bench.main(args,args.parser)
+#
+############################
+# Argument Parser
+############################
+#
+def build_parser():
+    parser = argparse.ArgumentParser(prog='tfluna',description='TF-Luna LiDAR command-line tool')
+    sensor = argparse.ArgumentParser(add_help=False) # options shared by the sensor commands
+    sensor.add_argument('--port',default='/dev/serial0',help='serial port (default /dev/serial0)')
+    sensor.add_argument('--baud',type=int,default=115200,help='port baud rate (default 115200)')
+    sensor.add_argument('--detect',action='store_true',help='probe for the sensor\'s baud rate first')
+    sensor.add_argument('--set-baud',type=int,help='change the sensor baud rate (port follows)')
+    sensor.add_argument('--rate',type=int,help='set the sample rate [Hz] (0 = trigger mode)')
+    subparsers = parser.add_subparsers(dest='command',metavar='command')
+
+    sub = subparsers.add_parser('read',parents=[sensor],help='print one (or --count) readings')
+    sub.add_argument('--count',type=int,default=1,help='number of readings')
+    sub.set_defaults(func=cmd_read)
+
+    sub = subparsers.add_parser('stream',parents=[sensor],help='stream frames as CSV')
+    sub.add_argument('--duration',type=float,help='stop after this many seconds')
+    sub.set_defaults(func=cmd_stream)
+
+    sub = subparsers.add_parser('config',parents=[sensor],help='configure the sensor')
+    sub.add_argument('--trigger',action='store_true',help='trigger mode (no continuous output)')
+    sub.add_argument('--standard-format',action='store_true',
+                     help='restore the standard 9-byte cm output (the only format read here)')
+    sub.add_argument('--factory-reset',action='store_true',help='restore factory settings')
+    sub.add_argument('--save',action='store_true',help='store the settings in flash')
+    sub.add_argument('--check',type=int,default=0,metavar='N',
+                     help='measure the sample rate over N frames afterwards')
+    sub.set_defaults(func=cmd_config)
+
+    sub = subparsers.add_parser('record',parents=[sensor],help='record frames to a binary file')
+    sub.add_argument('path',help='recording file (appended to if it exists)')
+    sub.add_argument('--duration',type=float,help='stop after this many seconds')
+    sub.set_defaults(func=cmd_record)
+
+    sub = subparsers.add_parser('plot',parents=[sensor],help='live dashboard or test plots')
+    sub.add_argument('--window',type=float,default=600.0,
+                     help='dashboard history [s] (not used by --realtime, always 100 samples)')
+    sub.add_argument('--png',help='headless: write the dashboard to this PNG file')
+    sub.add_argument('--interval',type=float,
+                     help='refresh interval [s] (default 1/30, 5 with --png)')
+    sub.add_argument('--realtime',action='store_true',help='blitted plot of the last 100 samples')
+    sub.add_argument('--samples',type=sample_count,default=0,metavar='N',
+                     help='plot N (>=2) samples and exit')
+    sub.set_defaults(func=cmd_plot)
+
+    sub = subparsers.add_parser('bench',help='benchmark suite against the simulator (JSON)')
+    sub.add_argument('suites',nargs='*',help='decoder, acquisition and/or plot (default: all)')
+    sub.add_argument('--duration',type=float,default=1.0,help='seconds per acquisition run')
+    sub.add_argument('--rates',type=int,nargs='+',default=[10,100,250],help='sample rates [Hz]')
+    sub.add_argument('-o','--output',help='write the JSON report to this file')
+    sub.set_defaults(func=cmd_bench,parser=sub)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- asyncio reader: frames and configuration
+# --- commands driven by loop.add_reader() on the
+# --- serial file descriptor (no threads, no polling)
+#
+#
+######################################################
+#
+import asyncio
+from tfluna_driver import TFLuna,baudrates
+from tfluna_serial import read_waiting
+from tfluna_clock import BITS_PER_BYTE,FrameClock
+from tfluna_commands import CMD_TIMEOUT,CMD_RETRIES,CMD_SAMPLE_RATE,CMD_BAUDRATE,\
+     CMD_FULL_VERSION,build_command,match_response,response_payload,\
+     sample_rate_payload,baudrate_payload
+#
+############################
+# Async TF-Luna
+############################
+#
+class AsyncTFLuna:
+    ##########################
+    # usage:
+    #   async with AsyncTFLuna("/dev/serial0") as luna:
+    #       await luna.set_sample_rate(100)
+    #       async for distance,strength,temperature in luna.frames():
+    #           ...
+    def __init__(self,port="/dev/serial0",baudrate=115200):
+        self.lidar = port if isinstance(port,TFLuna) else TFLuna(port,baudrate)
+        self.loop = None # event loop the reader is registered with
+        self.waiter = None # future resolved when new frames arrive
+        self.response = None # (cmd_id,future) while a command is in flight
+        self.closed = False # set by close(), ends frames()
+
+    async def open(self):
+        ##########################
+        # open the port and register the fd with the running event loop
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+        self.lidar.open()
+        self.loop.add_reader(self.lidar.fileno(),self._on_readable)
+        return self
+
+    async def close(self):
+        ##########################
+        # unregister the reader and close the port
+        if self.loop is not None and self.lidar.ser is not None:
+            self.loop.remove_reader(self.lidar.fileno())
+        self.lidar.close()
+        self.closed = True
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None) # wake a pending frames() consumer, it returns
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self,*exc_info):
+        await self.close()
+
+    def _on_readable(self):
+        ##########################
+        # event loop callback: drain the port, queue complete frames on the
+        # TFLuna (stamps, frame clock and metrics as in its own reads) for
+        # frames() and hand matching command responses to _command()
+        lidar = self.lidar
+        decoder = lidar.decoder
+        frames = read_waiting(lidar.ser,decoder)
+        if self.response is not None and decoder.responses:
+            cmd_id,future = self.response
+            resp = match_response(decoder.responses,cmd_id)
+            if resp is not None and not future.done():
+                future.set_result(resp)
+        if frames:
+            lidar._enqueue(frames)
+            if self.waiter is not None and not self.waiter.done():
+                self.waiter.set_result(None)
+
+    ############################
+    # Ranging Data
+    ############################
+    #
+    async def frames(self,stamped=False):
+        ##########################
+        # async iterator of (distance,strength,temperature) frames, or
+        # (t_ns,distance,strength,temperature) when stamped (as in
+        # TFLuna.read_many()); ends once the reader is closed
+        lidar = self.lidar
+        while True:
+            while lidar.frame_queue:
+                yield lidar._deliver(1,stamped)[0]
+            if self.closed:
+                return
+            self.waiter = self.loop.create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter = None
+
+    async def read(self):
+        ##########################
+        # await a single frame (None once closed)
+        async for frame in self.frames():
+            return frame
+        return None
+
+    ############################
+    # Configuration Commands
+    ############################
+    #
+    async def _command(self,cmd_id,payload=b'',timeout=CMD_TIMEOUT,retries=CMD_RETRIES):
+        ##########################
+        # send a checksummed command and await the response with the same
+        # ID, re-sending on timeout (None if it never came)
+        packet = build_command(cmd_id,payload)
+        decoder = self.lidar.decoder
+        decoder.accept_responses = True # parse 0x5a packets only while waiting
+        try:
+            for _ in range(retries):
+                future = self.loop.create_future()
+                self.response = (cmd_id,future)
+                self.lidar.ser.write(packet)
+                try:
+                    return await asyncio.wait_for(future,timeout)
+                except asyncio.TimeoutError:
+                    continue
+                finally:
+                    self.response = None
+            return None
+        finally:
+            decoder.accept_responses = False
+
+    async def set_sample_rate(self,samp_rate=100):
+        ##########################
+        # change the sample rate (1-250 Hz, 0 = trigger mode),
+        # returns the rate acknowledged by the sensor (None on failure)
+        resp = await self._command(CMD_SAMPLE_RATE,sample_rate_payload(samp_rate))
+        if resp is None:
+            return None
+        samp_rate = int.from_bytes(response_payload(resp),'little')
+        self.lidar.samp_rate = samp_rate
+        self.lidar.clock = FrameClock(samp_rate) if samp_rate>0 else None
+        return samp_rate
+
+    async def set_baudrate(self,baudrate=115200):
+        ##########################
+        # change the TF-Luna baudrate and follow it on the open port,
+        # returns the baudrate confirmed by the sensor (None on failure)
+        if baudrate not in baudrates:
+            raise ValueError('Unsupported baud rate: {0}'.format(baudrate))
+        ser = self.lidar.ser
+        payload = baudrate_payload(baudrate)
+        packet = build_command(CMD_BAUDRATE,payload)
+        ser.write(packet) # echo comes back at either rate
+        # let it leave at the old rate (no executor thread for ser.flush())
+        await asyncio.sleep(len(packet)*BITS_PER_BYTE/self.lidar.baudrate+0.002)
+        while ser.out_waiting:
+            await asyncio.sleep(0.001)
+        ser.baudrate = baudrate # reconfigure the open port
+        self.lidar.baudrate = baudrate
+        self.lidar.reset_stream() # bytes around the switch are garbage
+        resp = await self._command(CMD_BAUDRATE,payload) # confirm at the new rate
+        if resp is None:
+            return None
+        return int.from_bytes(response_payload(resp),'little')
+
+    async def version(self):
+        ##########################
+        # full version string reported by the TF-Luna (None on failure)
+        resp = await self._command(CMD_FULL_VERSION)
+        if resp is None:
+            return None
+        return response_payload(resp).decode('utf-8').rstrip('\x00 ')
@@ -0,0 +1,171 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- benchmark suite: frame decoding, end-to-end
+# --- acquisition against the pty simulator and the
+# --- real-time plot blit path; results as JSON
+#
+#
+######################################################
+#
+import json,platform,sys,time
+import numpy as np
+from tfluna_decoder import FRAME_LEN,FrameDecoder,decode_frame,decode_frames
+from tfluna_driver import TFLuna,baudrates,BITS_PER_BYTE
+from tfluna_sim import SimulatedTFLuna,make_frame
+#
+############################
+# Helpers
+############################
+#
+def best_of(func,repeat=5):
+    ##########################
+    # best wall time [s] of several runs (least disturbed by other load)
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best,time.perf_counter()-t0)
+    return best
+
+def make_stream(n_frames):
+    ##########################
+    # n_frames of valid data with varying distance/strength
+    return b''.join(make_frame(0.01*(ii % 800),100+ii % 30000,35.0) for ii in range(n_frames))
+#
+############################
+# Decoder Benchmarks
+############################
+#
+def bench_decoder(n_frames=100000,chunk_size=64,repeat=5):
+    ##########################
+    # per-frame (one 9-byte read at a time), streaming (chunked feed())
+    # and batched (decode_frames / feed_array) decoding of one stream
+    stream = make_stream(n_frames)
+
+    def per_frame():
+        for pos in range(0,len(stream),FRAME_LEN):
+            frame = stream[pos:pos+FRAME_LEN]
+            if frame[0]==0x59 and frame[1]==0x59 and (sum(frame[:8]) & 0xff)==frame[8]:
+                decode_frame(frame)
+
+    def streaming():
+        decoder = FrameDecoder()
+        for pos in range(0,len(stream),chunk_size):
+            decoder.feed(stream[pos:pos+chunk_size])
+
+    def streaming_array():
+        decoder = FrameDecoder()
+        for pos in range(0,len(stream),chunk_size*64):
+            decoder.feed_array(stream[pos:pos+chunk_size*64],timestamp=0.0)
+
+    def batched():
+        decode_frames(stream,timestamp=0.0)
+
+    results = {}
+    for name,func in [('per_frame',per_frame),('streaming',streaming),
+                      ('streaming_array',streaming_array),('batched',batched)]:
+        t = best_of(func,repeat)
+        results[name] = {'frames':n_frames,'seconds':t,
+                         'frames_per_s':n_frames/t,'ns_per_frame':1e9*t/n_frames}
+    return results
+#
+############################
+# Acquisition Benchmarks
+############################
+#
+def bench_acquisition(samp_rates=(10,100,250),duration=1.0,bauds=baudrates):
+    ##########################
+    # frames received, losses and CPU use for every baud/sample-rate pair
+    # against the simulator, which paces its output at the baud rate:
+    # where the line cannot carry the sample rate (line_load>1) the
+    # sensor skips frames and the measured rate tops out
+    results = []
+    for baudrate in bauds:
+        for samp_rate in samp_rates:
+            entry = {'baudrate':baudrate,'samp_rate':samp_rate,
+                     'line_load':samp_rate*FRAME_LEN*BITS_PER_BYTE/baudrate}
+            with SimulatedTFLuna(samp_rate=samp_rate,baudrate=baudrate) as sim:
+                with TFLuna(sim.port,baudrate) as lidar:
+                    n_frames = 0
+                    cpu0,t0 = time.process_time(),time.monotonic()
+                    while time.monotonic()-t0<duration:
+                        n_frames += len(lidar.read_many())
+                    elapsed = time.monotonic()-t0
+                    cpu = time.process_time()-cpu0
+                    entry.update({'frames':n_frames,'seconds':elapsed,
+                                  'measured_rate':n_frames/elapsed,
+                                  'frames_sent':sim.frames_sent,
+                                  'frames_skipped':sim.frames_skipped,
+                                  'checksum_errors':lidar.decoder.checksum_errors,
+                                  'bytes_discarded':lidar.decoder.bytes_discarded,
+                                  'cpu_fraction':cpu/elapsed}) # includes the simulator thread
+            results.append(entry)
+    return results
+#
+############################
+# Plot Benchmarks
+############################
+#
+def bench_plot(window_sizes=(100,1000,10000),n_updates=200,max_time=2.0):
+    ##########################
+    # plot_updater() blit path on the Agg backend (no display needed),
+    # n_updates per window size or max_time [s], whichever comes first
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from tfluna_realtime import plotter,plot_updater
+    results = []
+    for plot_pts in window_sizes:
+        fig,axs,ax1_bgnd,ax2_bgnd,line1,bar1,text1 = plotter(plot_pts)
+        dist = np.random.default_rng(0).uniform(0.0,8.0,plot_pts)
+        n_done,t0 = 0,time.perf_counter()
+        while n_done<n_updates and time.perf_counter()-t0<max_time:
+            line1,bar1,text1 = plot_updater(fig,axs,ax1_bgnd,ax2_bgnd,line1,bar1,text1,
+                                            np.roll(dist,n_done),1000.0,0)
+            n_done += 1
+        t = time.perf_counter()-t0
+        plt.close(fig)
+        results.append({'window':plot_pts,'updates':n_done,
+                        'ms_per_update':1e3*t/n_done,'updates_per_s':n_done/t})
+    return results
+#
+############################
+# Benchmark Runner
+############################
+#
+def run(suites=('decoder','acquisition','plot'),duration=1.0,samp_rates=(10,100,250)):
+    ##########################
+    # run the selected suites, returns a JSON-serialisable dict
+    report = {'timestamp':time.time(),'python':sys.version.split()[0],
+              'numpy':np.__version__,'platform':platform.platform(),
+              'machine':platform.machine()}
+    if 'decoder' in suites:
+        report['decoder'] = bench_decoder()
+    if 'acquisition' in suites:
+        report['acquisition'] = bench_acquisition(samp_rates,duration)
+    if 'plot' in suites:
+        report['plot'] = bench_plot()
+    return report
+
+def main(args,parser):
+    ##########################
+    # run the suites named in the parsed args, JSON to stdout or -o
+    suites = args.suites or ['decoder','acquisition','plot']
+    for suite in suites:
+        if suite not in ('decoder','acquisition','plot'):
+            parser.error('unknown suite: {0}'.format(suite))
+    report = run(suites,args.duration,args.rates)
+    text = json.dumps(report,indent=2)
+    if args.output:
+        with open(args.output,'w') as f:
+            f.write(text+'\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    import tfluna # same as: python3 tfluna.py bench ...
+    sys.exit(tfluna.main(['bench']+sys.argv[1:]))
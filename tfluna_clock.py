@@ -0,0 +1,107 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- frame clock: turns jittery host arrival stamps
+# --- into smooth sensor sample times, estimates the
+# --- sensor-vs-host drift and detects lost frames
+#
+#
+######################################################
+#
+############################
+# Arrival Stamps
+############################
+#
+BITS_PER_BYTE = 10 # UART start + 8 data + stop bits
+
+def arrival_stamps(t_read,n_frames,frame_len,trailing,baudrate):
+    ##########################
+    # per-frame arrival [ns] for n_frames decoded from one read at t_read
+    # [ns]: each frame's last byte came in no later than the transfer
+    # time of the bytes behind it (later frames + trailing partial bytes)
+    byte_ns = BITS_PER_BYTE*1e9/baudrate
+    return [t_read-int(((n_frames-1-ii)*frame_len+trailing)*byte_ns) for ii in range(n_frames)]
+#
+############################
+# Frame Clock
+############################
+#
+class FrameClock:
+    ##########################
+    # sample k of the sensor is modelled as t_k = t_model+(k-k_model)*period
+    # [ns], a phase-locked loop on the arrival stamps.
+    # Arrival stamps are only ever late (USB/UART latency, scheduling),
+    # never early, so the model follows the lower envelope of the
+    # arrivals: early residuals pull it down quickly, late ones only
+    # nudge it up. The period is re-measured every drift_window samples
+    # as the slope of the model over that window (the sensor's clock seen
+    # from the host), drift_ppm() compares it with the configured rate.
+    # Only the last frame of each read is used: it arrived most recently,
+    # the frames in front of it may have waited in the kernel buffer.
+    # A late read looks the same as lost frames, so frames are only
+    # counted as lost when the decoder had to re-sync (resynced=True).
+    def __init__(self,samp_rate,gain_early=0.2,gain_late=0.01,drift_window=2500,
+                 gap_tolerance=0.9):
+        self.nominal_period = 1e9/samp_rate # [ns] configured period
+        self.period = self.nominal_period # [ns] estimated period (host clock)
+        self.gain_early = gain_early # offset correction for early arrivals
+        self.gain_late = gain_late # offset correction for late arrivals
+        self.drift_window = drift_window # [samples] period estimation baseline
+        self.gap_tolerance = gap_tolerance # [periods] lateness still counted as jitter
+        self.t_model = None # [ns] model time of the last frame
+        self.k = -1 # sample index of the last frame
+        self.t_anchor,self.k_anchor = None,0 # start of the drift window
+        self.gaps = 0 # reads that followed lost frames
+        self.frames_lost = 0 # frames missing from the sample sequence
+        self.jitter = 0.0 # [ns] smoothed |residual|
+
+    def reset(self):
+        ##########################
+        # forget the model (e.g. after a sample rate change)
+        self.__init__(1e9/self.nominal_period,self.gain_early,self.gain_late,
+                      self.drift_window,self.gap_tolerance)
+
+    def update(self,stamps,resynced=False):
+        ##########################
+        # arrival stamps [ns] of the frames from one read (oldest first),
+        # resynced if bytes were discarded since the previous read;
+        # returns their model sample times [ns]
+        n = len(stamps)
+        if n==0:
+            return []
+        t_last = stamps[-1]
+        if self.t_model is None: # first read: start the model on it
+            self.t_model = self.t_anchor = float(t_last)
+            self.k = self.k_anchor = n-1
+            return [int(t_last-(n-1-ii)*self.period) for ii in range(n)]
+        k0 = self.k+1 # index of the first frame if nothing was lost
+        residual = t_last-(self.t_model+n*self.period)
+        missing = 0
+        if resynced and residual>0:
+            missing = int(residual/self.period+1.0-self.gap_tolerance)
+        if missing>0: # the last frame is whole periods late: frames were lost
+            self.gaps += 1
+            self.frames_lost += missing
+            k0 += missing
+            residual -= missing*self.period
+        elapsed = k0+n-1-self.k # samples since the last read
+        gain = self.gain_early if residual<0 else self.gain_late
+        self.t_model += elapsed*self.period+gain*residual
+        self.jitter += 0.01*(abs(residual)-self.jitter)
+        self.k = k0+n-1
+        if self.k-self.k_anchor>=self.drift_window: # re-measure the period
+            self.period = (self.t_model-self.t_anchor)/(self.k-self.k_anchor)
+            self.t_anchor,self.k_anchor = self.t_model,self.k
+        return [int(self.t_model-(n-1-ii)*self.period) for ii in range(n)]
+
+    def drift_ppm(self):
+        ##########################
+        # sensor clock error seen by the host [ppm], >0 = sensor runs slow
+        return (self.period/self.nominal_period-1.0)*1e6
+
+    def stats(self):
+        return {'period_ns':self.period,'drift_ppm':self.drift_ppm(),'gaps':self.gaps,
+                'frames_lost':self.frames_lost,'jitter_ns':self.jitter}
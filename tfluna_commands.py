@@ -0,0 +1,76 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- command packets: 0x5a <len> <id> <payload> <sum>
+#
+#
+######################################################
+#
+from tfluna_decoder import RESPONSE_HEADER
+#
+############################
+# Command IDs
+############################
+#
+CMD_FIRMWARE_VERSION = 0x01 # -> 5a 07 01 V1 V2 V3 SU
+CMD_SOFT_RESET       = 0x02 # -> 5a 05 02 status SU
+CMD_SAMPLE_RATE      = 0x03 # LL HH (0 = trigger mode) -> echo
+CMD_TRIGGER          = 0x04 # -> one data frame, no response packet
+CMD_OUTPUT_FORMAT    = 0x05 # format -> echo
+CMD_BAUDRATE         = 0x06 # 4-byte little-endian baudrate -> echo
+CMD_OUTPUT_ENABLE    = 0x07 # 0 = disable, 1 = enable -> echo
+CMD_FACTORY_RESET    = 0x10 # -> 5a 05 10 status SU
+CMD_SAVE_SETTINGS    = 0x11 # -> 5a 05 11 status SU
+CMD_FULL_VERSION     = 0x14 # -> 30-byte ASCII version packet
+CMD_AMP_THRESHOLD    = 0x22 # amp/10, dummy distance LL HH [cm] -> echo
+CMD_LOW_POWER        = 0x35 # sample rate (<=10 Hz, 0 = off), 0x00 -> echo
+
+FORMAT_STANDARD_CM = 0x01 # 9-byte frames, distance in cm (the decoder's format)
+FORMAT_PIXHAWK     = 0x02 # ASCII string output
+FORMAT_STANDARD_MM = 0x06 # 9-byte frames, distance in mm
+
+CMD_TIMEOUT = 0.1 # [s] per attempt (longest response is 30 bytes, ~31 ms at 9600 baud)
+CMD_RETRIES = 3 # attempts before giving up
+#
+############################
+# Packet Helpers
+############################
+#
+def build_command(cmd_id,payload=b''):
+    ##########################
+    # full command packet with length byte and checksum
+    packet = bytearray([RESPONSE_HEADER,4+len(payload),cmd_id])
+    packet += payload
+    packet.append(sum(packet) & 0xff) # checksum: low byte of the sum
+    return bytes(packet)
+
+def sample_rate_payload(samp_rate):
+    return samp_rate.to_bytes(2,'little')
+
+def baudrate_payload(baudrate):
+    return baudrate.to_bytes(4,'little')
+
+def amp_threshold_payload(amp_threshold,dummy_distance):
+    return bytes([min(amp_threshold//10,0xff)])+dummy_distance.to_bytes(2,'little')
+
+def response_status(response):
+    ##########################
+    # True if a status response (reset/save) reports success
+    return response is not None and response[3]==0x00
+
+def response_payload(response):
+    ##########################
+    # payload bytes of a response (between the ID and the checksum)
+    return response[3:-1]
+
+def match_response(responses,cmd_id):
+    ##########################
+    # pop the first queued response for cmd_id (older unmatched ones are dropped)
+    while responses:
+        response = responses.popleft()
+        if response[2]==cmd_id:
+            return response
+    return None
@@ -0,0 +1,235 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- long-history dashboard: min/max decimation
+# --- pyramid updated as frames arrive, so a refresh
+# --- costs the same for 10 s or 10 h of history;
+# --- on screen or headless (Agg -> PNG)
+#
+#
+######################################################
+#
+import os,time
+import numpy as np
+from tfluna_ringbuffer import RingBuffer
+from tfluna_live import run_live
+#
+############################
+# Min/Max Pyramid
+############################
+#
+bucket_dtype = np.dtype([('time','<f8'),('lo','<f4'),('hi','<f4')]) # 16 bytes per bucket
+
+class MinMaxPyramid:
+    ##########################
+    # level j holds (time,min,max) buckets of factor**j samples, each level
+    # in a RingBuffer of `capacity` buckets. Every factor buckets of a level
+    # are folded into one bucket of the next as they complete, so a sample
+    # costs O(1) amortized and memory is fixed: the defaults keep 33 s of
+    # raw samples and about 99 days of 17.5-minute buckets at 250 Hz. The
+    # leftover (not yet folded) buckets of each level are kept in
+    # self.pending. The rings get `headroom` extra buckets that window()
+    # never reads, room for extend() to write while a window is copied;
+    # self.updates is odd while extend() runs (window() retries then).
+    def __init__(self,capacity=8192,factor=4,levels=10,headroom=1024):
+        self.factor = factor
+        self.capacity = capacity # buckets per level visible to window()
+        self.levels = [RingBuffer(capacity+headroom,bucket_dtype) for _ in range(levels)]
+        self.pending = [np.empty(0,dtype=bucket_dtype) for _ in range(levels)]
+        self.updates = 0 # extend() calls started + finished
+
+    def extend(self,times,values):
+        ##########################
+        # add samples (times [s] ascending, values; NaN = gated sample)
+        self.updates += 1 # odd: levels and pending are changing
+        try:
+            self._extend(times,values)
+        finally:
+            self.updates += 1
+
+    def _extend(self,times,values):
+        buckets = np.empty(len(times),dtype=bucket_dtype)
+        buckets['time'] = times
+        buckets['lo'] = values
+        buckets['hi'] = values
+        factor = self.factor
+        for level,ring in enumerate(self.levels):
+            ring.extend(buckets)
+            if level==len(self.levels)-1:
+                break
+            buckets = np.concatenate([self.pending[level],buckets])
+            n_full = len(buckets)//factor*factor
+            self.pending[level] = buckets[n_full:].copy() # waits for the rest of its block
+            if n_full==0:
+                break
+            blocks = buckets[:n_full]
+            buckets = np.empty(n_full//factor,dtype=bucket_dtype)
+            buckets['time'] = blocks['time'][::factor] # bucket starts at its first sample
+            buckets['lo'] = np.fmin.reduce(blocks['lo'].reshape(-1,factor),axis=1) # NaN-skipping
+            buckets['hi'] = np.fmax.reduce(blocks['hi'].reshape(-1,factor),axis=1)
+
+    def latest_time(self):
+        times = self.levels[0].latest('time',1)
+        return times[0] if len(times) else None
+
+    def window(self,t_start,max_points=2000):
+        ##########################
+        # (times,lo,hi) from t_start to now using the finest level that
+        # fits in max_points buckets, plus the not yet folded buckets of
+        # the levels below it (the newest samples); cost depends on
+        # max_points and the number of levels only. Safe to call from
+        # another thread than extend(): a copy taken while extend() ran
+        # is thrown away and taken again.
+        while True:
+            updates = self.updates
+            if updates % 2==0:
+                out = self._window(t_start,max_points)
+                if self.updates==updates:
+                    return out['time'],out['lo'],out['hi']
+            time.sleep(0) # let extend() finish
+
+    def _window(self,t_start,max_points):
+        capacity = self.capacity
+        for level,ring in enumerate(self.levels):
+            count = ring.count # read once, every column is sliced at this count
+            times = ring.latest('time',capacity,count)
+            if len(times)==0:
+                first = 0 # nothing folded up to here yet, pending has it all
+                break
+            first = np.searchsorted(times,t_start)
+            covers = times[0]<=t_start or count<=capacity # whole window, or all there is
+            if (covers and len(times)-first<=max_points) or level==len(self.levels)-1:
+                break
+        n = len(times)-first
+        parts = [np.empty(n,dtype=bucket_dtype)]
+        parts[0]['time'] = times[first:]
+        parts[0]['lo'] = ring.latest('lo',n,count)
+        parts[0]['hi'] = ring.latest('hi',n,count)
+        parts += [self.pending[below] for below in range(level-1,-1,-1)] # coarse to fine
+        return np.concatenate(parts)
+#
+############################
+# Dashboard
+############################
+#
+def envelope(times,lo,hi):
+    ##########################
+    # one polyline through every bucket's min and max (vertical strokes
+    # where a bucket spans a range, a plain line at full resolution)
+    x = np.repeat(times,2)
+    y = np.empty(2*len(lo))
+    y[0::2] = lo
+    y[1::2] = hi
+    return x,y
+
+class Dashboard:
+    ##########################
+    # distance history over the last `window` seconds with auto-scaled
+    # y-limits, a strength bar and the dropped-frame counter. headless
+    # renders with Agg (no X display) for save(); otherwise pyplot is
+    # used and refresh() draws on screen. update() is the producer side
+    # (acquisition thread), refresh()/save() the consumer side.
+    def __init__(self,window=600.0,max_points=2000,headless=False,figsize=(12,8)):
+        self.window = window # [s] visible history
+        self.max_points = max_points # buckets drawn per refresh
+        self.headless = headless
+        self.pyramid = MinMaxPyramid()
+        self.strength = 1.0 # latest signal strength
+        self.dropped = 0 # frames lost (set by the owner)
+        if headless:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.fig = Figure(figsize=figsize)
+            FigureCanvasAgg(self.fig)
+            axs = self.fig.subplots(1,2,gridspec_kw={'width_ratios':[5,1]})
+        else:
+            import matplotlib.pyplot as plt
+            self.fig,axs = plt.subplots(1,2,figsize=figsize,gridspec_kw={'width_ratios':[5,1]})
+            self.fig.canvas.manager.set_window_title('TF-Luna Dashboard')
+        self.axs = axs
+        self.fig.subplots_adjust(wspace=0.05)
+        axs[0].set_xlabel('Time [s]',fontsize=16)
+        axs[0].set_ylabel('Distance [m]',fontsize=16)
+        axs[0].set_xlim([-window,0.0])
+        axs[1].set_xlim([-1.0,1.0]) # strength bar width
+        axs[1].set_xticks([])
+        axs[1].set_ylim([1.0,2**16])
+        axs[1].yaxis.tick_right()
+        axs[1].yaxis.set_label_position('right')
+        axs[1].set_ylabel('Signal Strength',fontsize=16,labelpad=6.0)
+        axs[1].set_yscale('log')
+        self.line, = axs[0].plot([],[],linewidth=1.5,color='tab:blue')
+        self.bar, = axs[1].bar(0.0,1.0,width=1.0,color='tab:green')
+        self.text = axs[0].text(0.02,0.95,'',transform=axs[0].transAxes,fontsize=14)
+        if not headless:
+            self.fig.show()
+
+    def update(self,frames):
+        ##########################
+        # stamped frames (t_ns,distance,strength,temperature), oldest first
+        if frames:
+            cols = np.array(frames,dtype=float)
+            self.pyramid.extend(cols[:,0]*1e-9,cols[:,1])
+            self.strength = cols[-1,2]
+
+    def draw(self):
+        ##########################
+        # update the artists from the pyramid (no canvas work)
+        t_now = self.pyramid.latest_time()
+        if t_now is None:
+            return False
+        times,lo,hi = self.pyramid.window(t_now-self.window,self.max_points)
+        x,y = envelope(times-t_now,lo,hi)
+        self.line.set_data(x,y)
+        valid = y[~np.isnan(y)]
+        if len(valid):
+            y_min,y_max = valid.min(),valid.max()
+            margin = max(0.05*(y_max-y_min),0.05) # [m]
+            self.axs[0].set_ylim([y_min-margin,y_max+margin])
+        self.bar.set_height(self.strength)
+        self.bar.set_color('tab:red' if self.strength<100.0 or self.strength>30000.0 else 'tab:green')
+        self.text.set_text('Dropped Frames: {0:d}'.format(self.dropped))
+        return True
+
+    def refresh(self):
+        ##########################
+        # redraw on screen (y-limits move, so a full draw, not blitting)
+        if self.draw():
+            self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+    def save(self,path):
+        ##########################
+        # render to PNG, replaced atomically for whoever serves the file
+        self.draw()
+        tmp = '{0}.{1}.tmp.png'.format(os.path.splitext(path)[0],os.getpid())
+        self.fig.savefig(tmp)
+        os.replace(tmp,path)
+
+def run_dashboard(lidar,window=600.0,png=None,interval=None):
+    ##########################
+    # acquisition thread + refresh loop until Ctrl+C, on screen or
+    # (png given) headless; the caller owns the open lidar
+    dashboard = Dashboard(window=window,headless=png is not None)
+    interval = interval or (5.0 if png else 1.0/30.0) # [s]
+
+    def consume(frames): # acquisition thread: serial -> pyramid
+        dashboard.update(frames)
+        if lidar.clock is not None:
+            dashboard.dropped = lidar.clock.frames_lost
+
+    def render():
+        if png:
+            dashboard.save(png)
+        else:
+            dashboard.refresh()
+
+    run_live(lidar,consume,render,interval)
+#
+if __name__ == '__main__':
+    import sys
+    from tfluna import main # same as: python3 tfluna.py plot --detect --rate 100 [--png ...]
+    main(['plot','--detect','--rate','100']+sys.argv[1:])
@@ -0,0 +1,249 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- streaming frame decoder for the TF-Luna data
+# --- output (re-syncs on the 0x59 0x59 header)
+#
+#
+######################################################
+#
+import struct,time
+from collections import deque
+#
+############################
+# Frame Definitions
+############################
+#
+FRAME_HEADER = b'\x59\x59' # two header bytes of every data frame
+FRAME_LEN = 9 # header (2) + distance (2) + strength (2) + temp (2) + checksum (1)
+RESPONSE_HEADER = 0x5a # first byte of command packets and their responses
+RESPONSE_MIN_LEN = 4 # header + length + command ID + checksum
+RESPONSE_MAX_LEN = 64 # longest response accepted from the stream
+frame_struct = struct.Struct('<HHH') # little-endian distance, strength, temperature
+_frame_dtype = None # bulk decode record, built on first use
+
+def get_frame_dtype():
+    ##########################
+    # NumPy record for bulk decoding; NumPy is imported here and in the
+    # batch functions, not with this module, so the streaming path (and
+    # a one-shot read) starts without it
+    global _frame_dtype
+    if _frame_dtype is None:
+        import numpy as np
+        _frame_dtype = np.dtype([('distance','<f4'),('strength','<u2'),
+                                 ('temperature','<f4'),('timestamp','<f8')])
+    return _frame_dtype
+
+def __getattr__(name):
+    ##########################
+    # `from tfluna_decoder import frame_dtype` keeps working (PEP 562)
+    if name=='frame_dtype':
+        return get_frame_dtype()
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__,name))
+
+def frame_checksum(frame):
+    ##########################
+    # checksum is the low byte of the sum of the first 8 bytes
+    return sum(frame[0:FRAME_LEN-1]) & 0xff
+
+def decode_frame(frame,offset=0):
+    ##########################
+    # decode a single 9-byte frame (header and checksum already verified)
+    distance,strength,temperature = frame_struct.unpack_from(frame,offset+2)
+    return distance/100.0,strength,(temperature/8.0)-256.0 # [m], 16-bit, [C]
+#
+############################
+# Batch Decoder (NumPy)
+############################
+#
+def find_frames(arr):
+    ##########################
+    # vectorized search for valid frames in a uint8 array, returns the
+    # start index of each frame (non-overlapping, earliest first) and the
+    # start index of every header candidate that failed its checksum
+    import numpy as np
+    n_starts = len(arr)-FRAME_LEN+1
+    if n_starts<1:
+        return np.empty(0,dtype=np.intp),np.empty(0,dtype=np.intp)
+    cand = np.flatnonzero((arr[:n_starts]==0x59) & (arr[1:n_starts+1]==0x59)) # headers
+    csum = np.zeros(len(arr)+1,dtype=np.uint32)
+    np.cumsum(arr,dtype=np.uint32,out=csum[1:]) # running sum for the checksums
+    valid = ((csum[cand+FRAME_LEN-1]-csum[cand]) & 0xff)==arr[cand+FRAME_LEN-1]
+    starts,bad = cand[valid],cand[~valid]
+    overlaps = np.flatnonzero(np.diff(starts)<FRAME_LEN) if len(starts)>1 else ()
+    if len(overlaps):
+        # a header pattern inside a valid frame also passed its checksum:
+        # walk only the overlapping pairs, keep the earliest frame of each
+        # group and skip anything it overlaps (the rest never collide)
+        drop = np.zeros(len(starts),dtype=bool)
+        next_free = 0
+        for ii in overlaps.tolist():
+            if not drop[ii]:
+                next_free = starts[ii]+FRAME_LEN # ii is kept
+            if starts[ii+1]<next_free:
+                drop[ii+1] = True
+        starts = starts[~drop]
+    if len(bad) and len(starts):
+        # failed candidates that sit inside an accepted frame are not errors
+        prev = np.searchsorted(starts,bad,side='right')-1
+        inside = (prev>=0) & (bad<starts[np.maximum(prev,0)]+FRAME_LEN)
+        bad = bad[~inside]
+    return starts,bad
+
+def frames_to_array(arr,starts,timestamp=None,samp_rate=None):
+    ##########################
+    # convert the frames at the given start indices into a structured array
+    import numpy as np
+    out = np.empty(len(starts),dtype=get_frame_dtype())
+    if len(starts)==0:
+        return out
+    rows = arr[starts[:,None]+np.arange(2,FRAME_LEN-1)] # (n,6) payload bytes
+    fields = rows.view('<u2') # (n,3) distance, strength, temperature
+    out['distance'] = fields[:,0]/100.0 # [m]
+    out['strength'] = fields[:,1] # 16-bit
+    out['temperature'] = (fields[:,2]/8.0)-256.0 # [C]
+    if timestamp is None:
+        timestamp = time.time() # block arrival time
+    if samp_rate:
+        # spread the block backwards in time, last frame arrived at timestamp
+        out['timestamp'] = timestamp-np.arange(len(starts)-1,-1,-1)/float(samp_rate)
+    else:
+        out['timestamp'] = timestamp
+    return out
+
+def decode_frames(block,timestamp=None,samp_rate=None):
+    ##########################
+    # decode every valid frame in one block of bytes (e.g. a whole
+    # ser.read(ser.in_waiting) or a capture file) into a structured array
+    import numpy as np
+    arr = np.frombuffer(block,dtype=np.uint8)
+    starts,_ = find_frames(arr)
+    return frames_to_array(arr,starts,timestamp,samp_rate)
+#
+############################
+# Streaming Decoder
+############################
+#
+class FrameDecoder:
+    ##########################
+    # keeps a rolling byte buffer between serial reads so that frames
+    # split across reads are completed instead of being thrown away
+    def __init__(self):
+        self.buffer = bytearray() # bytes not yet consumed
+        self.frames_decoded = 0 # number of valid frames returned
+        self.checksum_errors = 0 # frames with a bad checksum
+        self.bytes_discarded = 0 # bytes dropped while re-syncing
+        self.bytes_received = 0 # bytes fed in
+        self.buffer_overruns = 0 # reads that found the serial input buffer full
+        self.responses = deque(maxlen=16) # 0x5a command responses (oldest first)
+        self.accept_responses = False # set while a command waits for its response
+
+    def reset(self):
+        ##########################
+        # drop any partially received data and unclaimed responses
+        self.buffer.clear()
+        self.responses.clear()
+
+    def bytes_needed(self):
+        ##########################
+        # minimum number of bytes that could complete the next frame or
+        # response (never more than a frame, a candidate response may be junk)
+        buf = self.buffer
+        if self.accept_responses and len(buf)>1 and buf[0]==RESPONSE_HEADER and \
+                RESPONSE_MIN_LEN<=buf[1]<=RESPONSE_MAX_LEN:
+            return max(min(buf[1]-len(buf),FRAME_LEN),1) # rest of a command response
+        return max(FRAME_LEN-len(buf),1)
+
+    def _frame_in(self,start,end):
+        ##########################
+        # True if a complete, checksummed frame starts in buffer[start:end]
+        buf = self.buffer
+        indx = buf.find(FRAME_HEADER,start,end+1)
+        while 0<=indx<end:
+            if indx+FRAME_LEN<=len(buf) and \
+                    (sum(buf[indx:indx+FRAME_LEN-1]) & 0xff)==buf[indx+FRAME_LEN-1]:
+                return True
+            indx = buf.find(FRAME_HEADER,indx+1,end+1)
+        return False
+
+    def feed(self,data):
+        ##########################
+        # add raw serial bytes, return every complete frame as a list
+        # of (distance,strength,temperature) tuples; while accept_responses
+        # is set, 0x5a command responses are queued on self.responses
+        # (otherwise a stray 0x5a could hold back the frames behind it)
+        buf = self.buffer
+        accept_responses = self.accept_responses
+        buf += data
+        self.bytes_received += len(data)
+        frames = []
+        pos,end = 0,len(buf)
+        while pos<end:
+            head = buf[pos]
+            if head==0x59:
+                if end-pos<FRAME_LEN:
+                    break # wait for the rest of the frame
+                if buf[pos+1]==0x59:
+                    if (sum(buf[pos:pos+FRAME_LEN-1]) & 0xff)==buf[pos+FRAME_LEN-1]:
+                        frames.append(decode_frame(buf,pos))
+                        pos += FRAME_LEN
+                        continue
+                    self.checksum_errors += 1 # false header or corrupt frame
+            elif head==RESPONSE_HEADER and accept_responses:
+                if end-pos<2:
+                    break # wait for the length byte
+                length = buf[pos+1]
+                if RESPONSE_MIN_LEN<=length<=RESPONSE_MAX_LEN:
+                    if end-pos<length:
+                        if not self._frame_in(pos+1,pos+length):
+                            break # wait for the rest of the response
+                        self.bytes_discarded += 1 # a frame starts inside it: not a response
+                        pos += 1
+                        continue
+                    if (sum(buf[pos:pos+length-1]) & 0xff)==buf[pos+length-1]:
+                        self.responses.append(bytes(buf[pos:pos+length]))
+                        pos += length
+                        continue
+                    self.checksum_errors += 1
+            else:
+                # skip ahead to the next byte that can start a frame or response
+                indx = buf.find(0x59,pos)
+                indx_resp = buf.find(RESPONSE_HEADER,pos+1) if accept_responses else -1
+                if indx<0 or 0<=indx_resp<indx:
+                    indx = indx_resp
+                if indx<0:
+                    indx = end
+                self.bytes_discarded += indx-pos
+                pos = indx
+                continue
+            self.bytes_discarded += 1
+            pos += 1 # re-sync one byte later
+        del buf[:pos] # drop consumed bytes in one go
+        self.frames_decoded += len(frames)
+        return frames
+
+    def feed_array(self,data,timestamp=None,samp_rate=None):
+        ##########################
+        # vectorized counterpart of feed(), returns a structured array
+        # (frame_dtype) and keeps any trailing partial frame buffered
+        # (command responses are not extracted on this path)
+        import numpy as np
+        buf = self.buffer
+        buf += data
+        self.bytes_received += len(data)
+        arr = np.frombuffer(bytes(buf),dtype=np.uint8)
+        starts,bad = find_frames(arr)
+        out = frames_to_array(arr,starts,timestamp,samp_rate)
+        if len(starts):
+            pos = int(starts[-1])+FRAME_LEN # everything up to the last frame is consumed
+        else:
+            pos = 0
+        pos = max(pos,len(arr)-(FRAME_LEN-1)) # a shorter tail cannot hold a frame
+        self.checksum_errors += int(np.count_nonzero(bad<pos))
+        self.bytes_discarded += pos-FRAME_LEN*len(starts)
+        self.frames_decoded += len(starts)
+        del buf[:pos]
+        return out
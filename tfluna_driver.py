@@ -0,0 +1,425 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- TFLuna driver class: owns the serial port, the
+# --- frame decoder and the sensor configuration
+#
+#
+######################################################
+#
+import serial,time
+from collections import deque
+from tfluna_decoder import FrameDecoder,FRAME_LEN
+from tfluna_serial import READ_TIMEOUT,read_frames,read_available,read_waiting,wait_readable
+from tfluna_metrics import ReaderMetrics,write_textfile
+from tfluna_clock import BITS_PER_BYTE,FrameClock,arrival_stamps
+from tfluna_commands import CMD_TIMEOUT,CMD_RETRIES,CMD_FIRMWARE_VERSION,CMD_SOFT_RESET,\
+     CMD_SAMPLE_RATE,CMD_TRIGGER,CMD_OUTPUT_FORMAT,CMD_BAUDRATE,CMD_OUTPUT_ENABLE,\
+     CMD_FACTORY_RESET,CMD_SAVE_SETTINGS,CMD_FULL_VERSION,CMD_AMP_THRESHOLD,CMD_LOW_POWER,\
+     FORMAT_STANDARD_CM,build_command,match_response,response_payload,response_status,\
+     sample_rate_payload,baudrate_payload,amp_threshold_payload
+#
+############################
+# Sensor Settings
+############################
+#
+baudrates = [9600,19200,38400,57600,115200,230400,460800,921600] # supported baud rates
+probe_order = [115200,230400,460800,921600,57600,38400,19200,9600] # most likely first
+PROBE_WINDOW = 0.03 # [s] listening time per probed baud rate (plus transfer time)
+TRIGGER_PACKET = build_command(CMD_TRIGGER) # pre-built, measure() only writes it
+#
+############################
+# TF-Luna Driver
+############################
+#
+class TFLuna:
+    ##########################
+    # importing this module has no side effects, the port is only
+    # opened by open() (or a with-block) and stays open until close()
+    __slots__ = ('port','baudrate','timeout','samp_rate','ser','decoder','frame_queue',
+                 'arrival_queue','time_queue','clock','n_errors','metrics')
+
+    def __init__(self,port="/dev/serial0",baudrate=115200,timeout=READ_TIMEOUT):
+        self.port = port # serial device
+        self.baudrate = baudrate # current TF-Luna baudrate
+        self.timeout = timeout # [s] blocking read timeout
+        self.samp_rate = None # unknown until set_sample_rate()
+        self.ser = None # serial.Serial, created by open()
+        self.decoder = FrameDecoder() # streaming frame decoder
+        self.frame_queue = deque() # decoded frames not yet returned
+        self.arrival_queue = deque() # [ns] monotonic arrival of each queued frame
+        self.time_queue = deque() # [ns] sample time of each queued frame
+        self.clock = None # FrameClock, created by set_sample_rate()
+        self.n_errors = 0 # decoder error count at the last read (re-sync check)
+        self.metrics = ReaderMetrics() # always-on counters and histograms
+
+    def open(self):
+        ##########################
+        # open the serial port (no-op if already open)
+        if self.ser is None:
+            self.ser = serial.Serial(self.port,self.baudrate,timeout=self.timeout)
+        if self.ser.isOpen() == False:
+            self.ser.open() # open serial port if not open
+        return self
+
+    def close(self):
+        ##########################
+        # close the serial port and drop any buffered data
+        if self.ser is not None:
+            self.ser.close()
+            self.ser = None
+        self.reset_stream()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def fileno(self):
+        ##########################
+        # file descriptor of the open port (for select/selectors loops)
+        return self.ser.fileno()
+
+    ############################
+    # Ranging Data
+    ############################
+    #
+    def reset_stream(self):
+        ##########################
+        # drop buffered bytes and queued frames, restart the frame clock
+        self.decoder.reset()
+        self.frame_queue.clear()
+        self.arrival_queue.clear()
+        self.time_queue.clear()
+        if self.clock is not None:
+            self.clock.reset()
+
+    def _enqueue(self,frames):
+        ##########################
+        # queue frames from one serial read with per-frame arrival stamps
+        # (read time minus the transfer time of the bytes behind each frame)
+        # and their sample times from the frame clock
+        if frames:
+            t_read = time.monotonic_ns()
+            decoder = self.decoder
+            stamps = arrival_stamps(t_read,len(frames),FRAME_LEN,len(decoder.buffer),self.baudrate)
+            n_errors = decoder.bytes_discarded+decoder.checksum_errors+decoder.buffer_overruns
+            resynced,self.n_errors = n_errors!=self.n_errors,n_errors # frames may be missing
+            self.frame_queue.extend(frames)
+            self.arrival_queue.extend(stamps)
+            self.time_queue.extend(stamps if self.clock is None else self.clock.update(stamps,resynced))
+            self.metrics.on_frames(stamps,self.samp_rate)
+
+    def _deliver(self,n,stamped=False):
+        ##########################
+        # pop n queued frames (oldest first) and record their latency,
+        # stamped frames are (t_ns,distance,strength,temperature)
+        queue,arrivals,times,metrics = self.frame_queue,self.arrival_queue,self.time_queue,self.metrics
+        if stamped:
+            frames = [(times.popleft(),)+queue.popleft() for _ in range(n)]
+        else:
+            frames = [queue.popleft() for _ in range(n)]
+            for _ in range(n):
+                times.popleft()
+        t_now = time.monotonic_ns()
+        for _ in range(n):
+            metrics.on_deliver(arrivals.popleft(),1,t_now)
+        return frames
+
+    def read(self):
+        ##########################
+        # oldest (distance,strength,temperature) frame, None on timeout
+        if not self.frame_queue:
+            self._enqueue(read_frames(self.ser,self.decoder))
+            if not self.frame_queue:
+                return None # no data within the port timeout
+        return self._deliver(1)[0]
+
+    def read_many(self,n=None,stamped=False):
+        ##########################
+        # list of n frames (fewer on timeout), or every frame that is
+        # already waiting when n is None. stamped frames come as
+        # (t_ns,distance,strength,temperature), t_ns on the
+        # time.monotonic_ns() clock (smoothed once the sample rate is set)
+        queue = self.frame_queue
+        n_wait = 1 if n is None else n # wait for at least one frame
+        while len(queue)<n_wait:
+            frames = read_frames(self.ser,self.decoder)
+            if not frames:
+                break # timeout
+            self._enqueue(frames)
+        n = len(queue) if n is None else min(n,len(queue))
+        return self._deliver(n,stamped)
+
+    def read_waiting(self,stamped=False):
+        ##########################
+        # every frame already received, never blocks (for selector loops)
+        self._enqueue(read_waiting(self.ser,self.decoder))
+        return self._deliver(len(self.frame_queue),stamped)
+
+    ############################
+    # Metrics
+    ############################
+    #
+    def metrics_snapshot(self):
+        ##########################
+        # dict of reader metrics and decoder counters (plus the frame
+        # clock's drift and gap estimates once the sample rate is set)
+        snap = self.metrics.snapshot(self.decoder)
+        if self.clock is not None:
+            snap['clock'] = self.clock.stats()
+        return snap
+
+    def write_metrics(self,path):
+        ##########################
+        # Prometheus text file (node_exporter textfile collector)
+        write_textfile(path,self.metrics.prometheus(self.decoder,{'port':self.port}))
+
+    ############################
+    # Configuration Commands
+    ############################
+    #
+    def command(self,cmd_id,payload=b'',response=True,timeout=CMD_TIMEOUT,retries=CMD_RETRIES):
+        ##########################
+        # send a checksummed command and wait for the response with the same
+        # ID, picked out of the data stream (frames keep flowing into the
+        # frame queue, nothing is flushed). Returns the response packet,
+        # None if it never came, or the packet sent when response=False
+        packet = build_command(cmd_id,payload)
+        if not response:
+            self.ser.write(packet)
+            return packet
+        decoder = self.decoder
+        decoder.accept_responses = True # parse 0x5a packets only while waiting
+        try:
+            for _ in range(retries):
+                self.ser.write(packet)
+                t_end = time.monotonic()+timeout
+                while True:
+                    resp = match_response(decoder.responses,cmd_id)
+                    if resp is not None:
+                        return resp
+                    t_left = t_end-time.monotonic()
+                    if t_left<=0:
+                        break # re-send
+                    self._enqueue(read_available(self.ser,decoder,t_left))
+            return None
+        finally:
+            decoder.accept_responses = False
+
+    def set_sample_rate(self,samp_rate=100):
+        ##########################
+        # change the sample rate (1-250 Hz, 0 = trigger mode),
+        # returns the rate acknowledged by the sensor (None on failure)
+        resp = self.command(CMD_SAMPLE_RATE,sample_rate_payload(samp_rate))
+        if resp is None:
+            return None
+        self.samp_rate = int.from_bytes(response_payload(resp),'little')
+        self.clock = FrameClock(self.samp_rate) if self.samp_rate>0 else None
+        return self.samp_rate
+
+    def set_baudrate(self,baudrate=115200):
+        ##########################
+        # change the TF-Luna baudrate and follow it on the open port,
+        # returns the baudrate confirmed by the sensor (None on failure)
+        if baudrate not in baudrates:
+            raise ValueError('Unsupported baud rate: {0}'.format(baudrate))
+        payload = baudrate_payload(baudrate)
+        self.command(CMD_BAUDRATE,payload,response=False) # echo comes back at either rate
+        self.ser.flush() # make sure it left at the old rate
+        self.ser.baudrate = baudrate # reconfigure the open port
+        self.baudrate = baudrate
+        self.reset_stream() # bytes around the switch are garbage
+        resp = self.command(CMD_BAUDRATE,payload) # confirm at the new rate
+        if resp is None:
+            return None
+        return int.from_bytes(response_payload(resp),'little')
+
+    def version(self):
+        ##########################
+        # full version string reported by the TF-Luna (None on failure)
+        resp = self.command(CMD_FULL_VERSION)
+        if resp is None:
+            return None
+        return response_payload(resp).decode('utf-8').rstrip('\x00 ')
+
+    def firmware_version(self):
+        ##########################
+        # firmware version as 'V3.V2.V1' (None on failure)
+        resp = self.command(CMD_FIRMWARE_VERSION)
+        if resp is None or len(resp)<7:
+            return None
+        v1,v2,v3 = response_payload(resp)[:3]
+        return '{0}.{1}.{2}'.format(v3,v2,v1)
+
+    def soft_reset(self):
+        return response_status(self.command(CMD_SOFT_RESET))
+
+    def factory_reset(self):
+        return response_status(self.command(CMD_FACTORY_RESET))
+
+    def save_settings(self):
+        ##########################
+        # store the current configuration in the sensor's flash
+        return response_status(self.command(CMD_SAVE_SETTINGS))
+
+    def set_trigger_mode(self):
+        ##########################
+        # stop continuous output, frames only come after trigger()/measure()
+        return self.set_sample_rate(0)==0
+
+    def trigger(self):
+        ##########################
+        # request one frame (trigger mode), the frame arrives as data
+        self.command(CMD_TRIGGER,response=False)
+
+    ############################
+    # On-Demand Ranging
+    ############################
+    #
+    def send_trigger(self):
+        ##########################
+        # drop stale data and request one frame, returns the send time [ns]
+        counter = self.ser.in_waiting
+        if counter > 0:
+            self.decoder.feed(self.ser.read(counter)) # keeps the counters right
+        self.frame_queue.clear()
+        self.arrival_queue.clear()
+        self.time_queue.clear()
+        t_sent = time.monotonic_ns()
+        self.ser.write(TRIGGER_PACKET)
+        return t_sent
+
+    def take_measurement(self,t_sent):
+        ##########################
+        # the triggered frame if it has arrived (never blocks) as
+        # (distance,strength,temperature,latency [s]), else None
+        if not self.frame_queue:
+            counter = self.ser.in_waiting
+            if counter > 0:
+                self._enqueue(self.decoder.feed(self.ser.read(counter)))
+            if not self.frame_queue:
+                return None
+        latency = (self.arrival_queue[0]-t_sent)*1e-9 # trigger -> frame bytes in
+        return self._deliver(1)[0]+(latency,)
+
+    def measure(self,timeout=CMD_TIMEOUT):
+        ##########################
+        # one on-demand reading in trigger mode: send the trigger, sleep on
+        # the fd until the frame is in, return (distance,strength,
+        # temperature,latency [s]) or None on timeout
+        t_sent = self.send_trigger()
+        t_end = time.monotonic()+timeout
+        while True:
+            result = self.take_measurement(t_sent)
+            if result is not None:
+                return result
+            t_left = t_end-time.monotonic()
+            if t_left<=0 or not wait_readable(self.ser,t_left):
+                return None
+
+    def set_output_format(self,output_format=FORMAT_STANDARD_CM):
+        return self.command(CMD_OUTPUT_FORMAT,bytes([output_format])) is not None
+
+    def set_output(self,enable=True):
+        ##########################
+        # enable/disable the data output (commands keep working)
+        return self.command(CMD_OUTPUT_ENABLE,bytes([1 if enable else 0])) is not None
+
+    def set_low_power(self,samp_rate=0):
+        ##########################
+        # low-power mode at samp_rate (<=10 Hz), 0 switches it off
+        return self.command(CMD_LOW_POWER,bytes([samp_rate,0x00])) is not None
+
+    def set_amp_threshold(self,amp_threshold=100,dummy_distance=0):
+        ##########################
+        # frames with strength below amp_threshold report dummy_distance [cm]
+        payload = amp_threshold_payload(amp_threshold,dummy_distance)
+        return self.command(CMD_AMP_THRESHOLD,payload) is not None
+
+    ############################
+    # Baud Rate Discovery
+    ############################
+    #
+    def probe_baudrate(self,baudrate,window=PROBE_WINDOW):
+        ##########################
+        # switch the port to baudrate and listen for valid frames or a
+        # version response (covers sensors in trigger mode or with the
+        # output disabled); garbage at the wrong rate fails the checksums
+        self.ser.baudrate = baudrate
+        self.ser.reset_input_buffer()
+        self.reset_stream()
+        self.ser.write(build_command(CMD_FIRMWARE_VERSION))
+        t_end = time.monotonic()+window+30*BITS_PER_BYTE/baudrate
+        n_frames = 0
+        self.decoder.accept_responses = True
+        try:
+            while True:
+                n_frames += len(read_available(self.ser,self.decoder,t_end-time.monotonic()))
+                if n_frames>=2 or self.decoder.responses:
+                    self.decoder.responses.clear()
+                    self.baudrate = baudrate
+                    return True
+                if time.monotonic()>=t_end:
+                    return False
+        finally:
+            self.decoder.accept_responses = False
+
+    def detect_baudrate(self,candidates=probe_order,window=PROBE_WINDOW):
+        ##########################
+        # find the sensor's current baud rate, the port is left at that
+        # rate (returns None and restores the old rate if none answered)
+        prev = self.baudrate
+        for baudrate in candidates:
+            if self.probe_baudrate(baudrate,window):
+                return baudrate
+        self.ser.baudrate = prev
+        return None
+
+    def link_ok(self,samp_rate,test_time=0.1):
+        ##########################
+        # True if frames arrive at ~samp_rate with no checksum/sync errors
+        errors = self.decoder.checksum_errors+self.decoder.bytes_discarded
+        frames = []
+        t_end = time.monotonic()+test_time
+        while time.monotonic()<t_end:
+            frames += read_available(self.ser,self.decoder,t_end-time.monotonic())
+        if self.decoder.checksum_errors+self.decoder.bytes_discarded>errors:
+            return False
+        return samp_rate==0 or len(frames)>=0.8*samp_rate*test_time
+
+    def negotiate_baudrate(self,samp_rate=100,max_baudrate=921600,test_time=0.1):
+        ##########################
+        # move to the highest baud rate (<= max_baudrate) that carries
+        # samp_rate cleanly, stepping down on errors; returns the rate
+        # in use (None if the sensor was lost)
+        min_baudrate = samp_rate*FRAME_LEN*BITS_PER_BYTE # bits/s the stream needs
+        for baudrate in sorted(baudrates,reverse=True):
+            if baudrate>max_baudrate or baudrate<min_baudrate:
+                continue
+            if self.set_baudrate(baudrate)==baudrate and \
+                    self.set_sample_rate(samp_rate)==samp_rate and \
+                    self.link_ok(samp_rate,test_time):
+                return baudrate
+            if self.detect_baudrate() is None: # find the sensor again, then step down
+                return None
+        return self.baudrate if self.baudrate>=min_baudrate else None
+#
+############################
+# Fleet Helpers
+############################
+#
+def detect_baudrates(ports,candidates=probe_order,window=PROBE_WINDOW):
+    ##########################
+    # detect the baud rate of several sensors in parallel (one thread
+    # per port), returns {port: baudrate or None}
+    from concurrent.futures import ThreadPoolExecutor # only needed here (startup time)
+    def detect(port):
+        with TFLuna(port) as lidar:
+            return lidar.detect_baudrate(candidates,window)
+    with ThreadPoolExecutor(max_workers=max(len(ports),1)) as pool:
+        return dict(zip(ports,pool.map(detect,ports)))
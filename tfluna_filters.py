@@ -0,0 +1,208 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- on-line filters for the distance stream:
+# --- strength gating, rolling median, EMA and a 1-D
+# --- Kalman filter, per sample or vectorized per batch
+#
+#
+######################################################
+#
+import bisect,math
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+#
+############################
+# Filter Helpers
+############################
+#
+# every filter has update(distance,strength) for one sample and
+# filter_batch(distances,strengths) for arrays (e.g. from decode_frames);
+# both give the same output. Gated samples are NaN, later stages pass
+# NaN through without touching their state.
+#
+def ema_batch(values,y_prev,alpha):
+    ##########################
+    # y[n] = y[n-1]+alpha*(x[n]-y[n-1]) over a NaN-free array without a
+    # Python loop: closed form in chunks short enough that (1-alpha)**-m
+    # stays well inside double precision. Returns (y,last y)
+    beta = 1.0-alpha
+    out = np.empty(len(values))
+    if beta<=0.0:
+        out[:] = values # alpha=1: no smoothing
+        return out,(values[-1] if len(values) else y_prev)
+    m = max(int(12.0*math.log(10.0)/-math.log(beta)),1) if beta<1.0 else len(values)
+    for start in range(0,len(values),m):
+        x = values[start:start+m]
+        if y_prev is None or math.isnan(y_prev):
+            y_prev = x[0] # start from the first sample
+        powers = beta**np.arange(len(x)) # b^n
+        scaled = np.cumsum(x/powers) # sum x_k b^-k
+        out[start:start+m] = beta*powers*y_prev+alpha*powers*scaled
+        y_prev = out[start+len(x)-1]
+    return out,y_prev
+
+def apply_valid(values,func):
+    ##########################
+    # run func on the non-NaN samples only and scatter the result back
+    values = np.asarray(values,dtype=float)
+    valid = ~np.isnan(values)
+    out = np.full(len(values),np.nan)
+    if valid.any():
+        out[valid] = func(values[valid])
+    return out
+#
+############################
+# Filters
+############################
+#
+class StrengthGate:
+    ##########################
+    # the TF-Luna's distance is unreliable for strength <100 or >30000
+    # (the red bar in tfluna_realtime.py); those samples become NaN
+    def __init__(self,min_strength=100.0,max_strength=30000.0):
+        self.min_strength = min_strength
+        self.max_strength = max_strength
+
+    def update(self,distance,strength):
+        if strength<self.min_strength or strength>self.max_strength:
+            return math.nan
+        return distance
+
+    def filter_batch(self,distances,strengths):
+        strengths = np.asarray(strengths)
+        out = np.array(distances,dtype=float)
+        out[(strengths<self.min_strength) | (strengths>self.max_strength)] = np.nan
+        return out
+
+class RollingMedian:
+    ##########################
+    # median of the last `window` valid samples (sorted window: bisect
+    # search plus a small memmove per sample)
+    def __init__(self,window=5):
+        self.window = window
+        self.history = deque() # valid samples in arrival order
+        self.sorted = [] # the same samples, sorted
+
+    def update(self,distance,strength=None):
+        if math.isnan(distance):
+            return math.nan
+        self.history.append(distance)
+        bisect.insort(self.sorted,distance)
+        if len(self.history)>self.window:
+            del self.sorted[bisect.bisect_left(self.sorted,self.history.popleft())]
+        n = len(self.sorted)
+        if n % 2:
+            return self.sorted[n//2]
+        return 0.5*(self.sorted[n//2-1]+self.sorted[n//2])
+
+    def filter_batch(self,distances,strengths=None):
+        return apply_valid(distances,self._median_valid)
+
+    def _median_valid(self,values):
+        out = np.empty(len(values))
+        n_warm = min(max(self.window-1-len(self.history),0),len(values))
+        for ii in range(n_warm): # partial windows while the history fills
+            out[ii] = self.update(values[ii])
+        rest = values[n_warm:]
+        if len(rest):
+            seq = np.concatenate([np.fromiter(self.history,float,len(self.history))[-(self.window-1):]
+                                  if self.window>1 else np.empty(0),rest])
+            out[n_warm:] = np.median(sliding_window_view(seq,self.window),axis=1)
+            for value in seq[-self.window:]: # leave the state as update() would
+                self.update(value)
+        return out
+
+class EMA:
+    ##########################
+    # exponential moving average, y += alpha*(x-y)
+    def __init__(self,alpha=0.2):
+        self.alpha = alpha
+        self.y = None # last output (None until the first valid sample)
+
+    def update(self,distance,strength=None):
+        if math.isnan(distance):
+            return math.nan
+        if self.y is None:
+            self.y = distance
+        else:
+            self.y += self.alpha*(distance-self.y)
+        return self.y
+
+    def filter_batch(self,distances,strengths=None):
+        def smooth(values):
+            out,self.y = ema_batch(values,self.y,self.alpha)
+            return out
+        return apply_valid(distances,smooth)
+
+class Kalman1D:
+    ##########################
+    # constant-distance Kalman filter: process_var q [m^2 per sample],
+    # measurement_var r [m^2]. The gain does not depend on the data and
+    # settles to a constant, after which the filter is an EMA with
+    # alpha = steady-state gain, which is what filter_batch() vectorizes.
+    def __init__(self,process_var=1e-4,measurement_var=4e-4):
+        self.q = process_var
+        self.r = measurement_var
+        self.x = None # distance estimate [m]
+        self.p = 1.0 # estimate variance [m^2]
+        p_prior = 0.5*(self.q+math.sqrt(self.q*self.q+4.0*self.q*self.r))
+        self.k_ss = p_prior/(p_prior+self.r) # steady-state gain
+
+    def update(self,distance,strength=None):
+        if math.isnan(distance):
+            return math.nan
+        if self.x is None:
+            self.x,self.p = distance,self.r # first measurement
+            return self.x
+        p_prior = self.p+self.q
+        gain = p_prior/(p_prior+self.r)
+        self.x += gain*(distance-self.x)
+        self.p = (1.0-gain)*p_prior
+        return self.x
+
+    def converged(self):
+        p_prior = self.p+self.q
+        return abs(p_prior/(p_prior+self.r)-self.k_ss)<1e-9
+
+    def filter_batch(self,distances,strengths=None):
+        def smooth(values):
+            out = np.empty(len(values))
+            ii = 0
+            while ii<len(values) and (self.x is None or not self.converged()):
+                out[ii] = self.update(values[ii]) # gain still settling
+                ii += 1
+            if ii<len(values):
+                out[ii:],self.x = ema_batch(values[ii:],self.x,self.k_ss)
+            return out
+        return apply_valid(distances,smooth)
+#
+############################
+# Filter Chain
+############################
+#
+class FilterChain:
+    ##########################
+    # e.g. FilterChain(StrengthGate(),RollingMedian(5),Kalman1D())
+    def __init__(self,*filters):
+        self.filters = list(filters)
+
+    def update(self,distance,strength):
+        for stage in self.filters:
+            distance = stage.update(distance,strength)
+        return distance
+
+    def filter_batch(self,distances,strengths):
+        distances = np.asarray(distances,dtype=float)
+        for stage in self.filters:
+            distances = stage.filter_batch(distances,strengths)
+        return distances
+
+    def filter_records(self,records):
+        ##########################
+        # filtered distances of a frame_dtype structured array
+        return self.filter_batch(records['distance'],records['strength'])
@@ -0,0 +1,51 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- live loop shared by the real-time plot and the
+# --- dashboard: acquisition thread at the sensor rate,
+# --- rendering at its own rate in the main thread
+#
+#
+######################################################
+#
+import threading,time
+#
+############################
+# Live Loop
+############################
+#
+def acquire(lidar,consume,stop_event):
+    ##########################
+    # acquisition thread: every read_many() batch of stamped frames
+    # (t_ns,distance,strength,temperature) goes to consume(), the
+    # serial port is never left waiting on plotting
+    while not stop_event.is_set():
+        frames = lidar.read_many(stamped=True)
+        if frames:
+            consume(frames)
+
+def run_live(lidar,consume,render,interval):
+    ##########################
+    # acquisition thread + render() every interval [s] until Ctrl+C;
+    # the caller owns the open lidar
+    stop_event = threading.Event()
+    reader = threading.Thread(target=acquire,args=(lidar,consume,stop_event),daemon=True)
+    reader.start()
+    t_next = time.monotonic()
+    try:
+        while True:
+            render()
+            t_next += interval
+            t_sleep = t_next-time.monotonic()
+            if t_sleep>0:
+                time.sleep(t_sleep) # hold the render rate
+            else:
+                t_next = time.monotonic() # rendering is slower than the interval, don't catch up
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        reader.join()
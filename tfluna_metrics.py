@@ -0,0 +1,157 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- always-on reader metrics: frame/error counters,
+# --- inter-frame jitter and read-to-delivery latency
+# --- histograms, snapshot dict and Prometheus text
+#
+#
+######################################################
+#
+import bisect,os,time
+#
+############################
+# Histogram
+############################
+#
+def label_block(labels):
+    ##########################
+    # 'a="b",' -> '{a="b"}', '' -> ''
+    labels = labels.rstrip(',')
+    return '{{{0}}}'.format(labels) if labels else ''
+
+LATENCY_BUCKETS = [1e-5,3e-5,1e-4,3e-4,1e-3,3e-3,1e-2,3e-2,1e-1,3e-1,1.0] # [s]
+INTERVAL_BUCKETS = [1e-4,1e-3,2e-3,4e-3,5e-3,1e-2,2e-2,5e-2,1e-1,2e-1,1.0] # [s]
+
+class Histogram:
+    ##########################
+    # fixed-bucket histogram (upper bounds in seconds), O(log buckets)
+    __slots__ = ('bounds','counts','total','count')
+
+    def __init__(self,bounds):
+        self.bounds = list(bounds)
+        self.counts = [0]*(len(self.bounds)+1) # last bucket is +Inf
+        self.total = 0.0 # sum of observations
+        self.count = 0
+
+    def observe(self,value,n=1):
+        self.counts[bisect.bisect_left(self.bounds,value)] += n
+        self.total += value*n
+        self.count += n
+
+    def snapshot(self):
+        return {'buckets':self.bounds+[float('inf')],'counts':list(self.counts),
+                'sum':self.total,'count':self.count}
+
+    def prometheus(self,name,labels):
+        ##########################
+        # cumulative _bucket lines plus _sum and _count
+        lines,cumulative = [],0
+        for bound,count in zip(self.bounds+['+Inf'],self.counts):
+            cumulative += count
+            le = bound if bound=='+Inf' else repr(bound)
+            lines.append('{0}_bucket{{{1}le="{2}"}} {3}'.format(name,labels,le,cumulative))
+        lines.append('{0}_sum{1} {2!r}'.format(name,label_block(labels),self.total))
+        lines.append('{0}_count{1} {2}'.format(name,label_block(labels),self.count))
+        return lines
+#
+############################
+# Reader Metrics
+############################
+#
+class ReaderMetrics:
+    ##########################
+    # updated once per serial read and once per delivered frame; the
+    # decoder keeps the byte-level counters (resync, checksum, overruns)
+    __slots__ = ('frames_delivered','t_last','jitter_sum','jitter_max','jitter_count',
+                 'interval','latency')
+
+    def __init__(self):
+        self.frames_delivered = 0 # frames handed to the caller
+        self.t_last = None # [ns] arrival of the previous frame
+        self.jitter_sum = 0.0 # sum of |interval-1/samp_rate| [s]
+        self.jitter_max = 0.0
+        self.jitter_count = 0
+        self.interval = Histogram(INTERVAL_BUCKETS) # per-frame arrival interval
+        self.latency = Histogram(LATENCY_BUCKETS) # read -> delivery
+
+    def on_frames(self,stamps,samp_rate=None):
+        ##########################
+        # frames from one read with their own arrival stamps [ns] (oldest
+        # first): each frame's interval to the one before it
+        t_last,interval_hist = self.t_last,self.interval
+        period = 1.0/samp_rate if samp_rate else None
+        for t_arrival in stamps:
+            if t_last is not None:
+                interval = (t_arrival-t_last)*1e-9
+                interval_hist.observe(interval)
+                if period is not None:
+                    jitter = abs(interval-period)
+                    self.jitter_sum += jitter
+                    self.jitter_count += 1
+                    if jitter>self.jitter_max:
+                        self.jitter_max = jitter
+            t_last = t_arrival
+        self.t_last = t_last
+
+    def on_deliver(self,t_arrival,n_frames=1,t_now=None):
+        ##########################
+        # n_frames that arrived at t_arrival [ns] were just returned
+        if t_now is None:
+            t_now = time.monotonic_ns()
+        self.latency.observe((t_now-t_arrival)*1e-9,n_frames)
+        self.frames_delivered += n_frames
+
+    def snapshot(self,decoder=None):
+        ##########################
+        # plain dict of every metric (decoder counters included if given)
+        snap = {'frames_delivered':self.frames_delivered,
+                'jitter_mean':self.jitter_sum/self.jitter_count if self.jitter_count else 0.0,
+                'jitter_max':self.jitter_max,
+                'frame_interval':self.interval.snapshot(),
+                'delivery_latency':self.latency.snapshot()}
+        if decoder is not None:
+            snap.update({'frames_decoded':decoder.frames_decoded,
+                         'bytes_received':decoder.bytes_received,
+                         'bytes_discarded':decoder.bytes_discarded,
+                         'checksum_errors':decoder.checksum_errors,
+                         'buffer_overruns':decoder.buffer_overruns})
+        return snap
+
+    def prometheus(self,decoder=None,labels=None):
+        ##########################
+        # Prometheus text exposition of snapshot()
+        label_str = ''.join('{0}="{1}",'.format(k,v) for k,v in sorted((labels or {}).items()))
+        snap = self.snapshot(decoder)
+        lines = []
+        for key,kind,help_text in [
+                ('frames_decoded','counter','Valid frames decoded'),
+                ('frames_delivered','counter','Frames returned to the caller'),
+                ('bytes_received','counter','Bytes read from the serial port'),
+                ('bytes_discarded','counter','Bytes discarded while re-syncing'),
+                ('checksum_errors','counter','Frames or responses with a bad checksum'),
+                ('buffer_overruns','counter','Reads that found the serial input buffer full'),
+                ('jitter_mean','gauge','Mean inter-frame jitter in seconds'),
+                ('jitter_max','gauge','Largest inter-frame jitter in seconds')]:
+            if key not in snap:
+                continue
+            name = 'tfluna_{0}{1}'.format(key,'_total' if kind=='counter' else '_seconds')
+            lines += ['# HELP {0} {1}'.format(name,help_text),'# TYPE {0} {1}'.format(name,kind),
+                      '{0}{1} {2!r}'.format(name,label_block(label_str),snap[key])]
+        for name,hist,help_text in [
+                ('tfluna_frame_interval_seconds',self.interval,'Per-frame arrival interval'),
+                ('tfluna_delivery_latency_seconds',self.latency,'Serial read to delivery latency')]:
+            lines += ['# HELP {0} {1}'.format(name,help_text),'# TYPE {0} histogram'.format(name)]
+            lines += hist.prometheus(name,label_str)
+        return '\n'.join(lines)+'\n'
+
+def write_textfile(path,text):
+    ##########################
+    # atomic write for the node_exporter textfile collector
+    tmp = '{0}.{1}.tmp'.format(path,os.getpid())
+    with open(tmp,'w') as f:
+        f.write(text)
+    os.replace(tmp,path)
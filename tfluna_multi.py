@@ -0,0 +1,127 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDARs wired to several UARTs
+# --- concurrent acquisition from N sensors with a
+# --- single selector loop, merged into one time-ordered
+# --- stream tagged with sensor IDs
+#
+#
+######################################################
+#
+import heapq,selectors,time
+from tfluna_driver import TFLuna
+from tfluna_commands import CMD_TIMEOUT
+#
+############################
+# Sensor Array
+############################
+#
+class SensorArray:
+    ##########################
+    # sensors: list of serial ports (the port is the sensor ID), or a dict
+    # of {sensor_id: port or TFLuna}; frames come out as
+    # (timestamp,sensor_id,distance,strength,temperature) tuples with the
+    # per-frame timestamp [s] on the time.monotonic() clock (smoothed by
+    # each sensor's frame clock once its sample rate is set).
+    # Smoothed times can lie before the frames arrived, so frames are held
+    # back until every sensor has sent a later one (the watermark), or at
+    # most max_lag [s] for a sensor that went quiet
+    def __init__(self,sensors,baudrate=115200,max_lag=0.1):
+        if not isinstance(sensors,dict):
+            sensors = {port:port for port in sensors}
+        self.sensors = {} # sensor_id -> TFLuna
+        for sensor_id,lidar in sensors.items():
+            if not isinstance(lidar,TFLuna):
+                lidar = TFLuna(lidar,baudrate)
+            self.sensors[sensor_id] = lidar
+        self.selector = None # created by open()
+        self.max_lag = max_lag # [s] longest wait for a quiet sensor
+        self.pending = [] # heap of (timestamp,n,frame) not yet released
+        self.n_pending = 0 # frames pushed (tie-breaker, keeps per-sensor order)
+        self.latest = dict.fromkeys(self.sensors,float('-inf')) # [s] newest stamp per sensor
+
+    def open(self):
+        ##########################
+        # open every port and register it with the selector
+        self.selector = selectors.DefaultSelector()
+        for sensor_id,lidar in self.sensors.items():
+            lidar.open()
+            self.selector.register(lidar.fileno(),selectors.EVENT_READ,sensor_id)
+        return self
+
+    def close(self):
+        ##########################
+        # unregister and close every port
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+        self.pending.clear()
+        self.latest = dict.fromkeys(self.sensors,float('-inf'))
+        for lidar in self.sensors.values():
+            lidar.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def poll(self,timeout=None):
+        ##########################
+        # sleep until any port has data (or timeout), then drain every
+        # ready port and return the frames below the watermark in time
+        # order (later polls never return older frames)
+        pending = self.pending
+        for key,_ in self.selector.select(timeout):
+            sensor_id = key.data
+            frames = self.sensors[sensor_id].read_waiting(stamped=True)
+            for t_ns,distance,strength,temperature in frames:
+                timestamp = t_ns*1e-9
+                heapq.heappush(pending,(timestamp,self.n_pending,
+                                        (timestamp,sensor_id,distance,strength,temperature)))
+                self.n_pending += 1
+            if frames:
+                self.latest[sensor_id] = frames[-1][0]*1e-9
+        watermark = max(min(self.latest.values()),time.monotonic()-self.max_lag)
+        merged = []
+        while pending and pending[0][0]<=watermark:
+            merged.append(heapq.heappop(pending)[2])
+        return merged
+
+    def set_trigger_mode(self):
+        ##########################
+        # put every sensor in trigger mode (True if all acknowledged)
+        return all([lidar.set_trigger_mode() for lidar in self.sensors.values()])
+
+    def measure(self,timeout=CMD_TIMEOUT):
+        ##########################
+        # trigger every sensor back to back, then collect one frame from
+        # each as it arrives: {sensor_id: (distance,strength,temperature,
+        # latency [s])}, None for sensors that did not answer in time
+        t_sent = {sensor_id:lidar.send_trigger() for sensor_id,lidar in self.sensors.items()}
+        results = dict.fromkeys(self.sensors)
+        t_end = time.monotonic()+timeout
+        while None in results.values():
+            t_left = t_end-time.monotonic()
+            if t_left<=0:
+                break
+            for key,_ in self.selector.select(t_left):
+                sensor_id = key.data
+                if results[sensor_id] is None:
+                    results[sensor_id] = self.sensors[sensor_id].take_measurement(t_sent[sensor_id])
+                else:
+                    self.sensors[sensor_id].read_waiting() # extra bytes, don't spin on them
+        return results
+
+    def frames(self,timeout=None):
+        ##########################
+        # endless merged stream (stops if a poll times out with no data
+        # and nothing is held back)
+        while True:
+            merged = self.poll(timeout)
+            if not merged and timeout is not None and not self.pending:
+                return
+            yield from merged
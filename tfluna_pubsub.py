@@ -0,0 +1,278 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- publish/subscribe of decoded frames: fixed-size
+# --- binary messages over Unix/UDP datagram sockets,
+# --- or a shared-memory ring for same-host consumers
+#
+#
+######################################################
+#
+import os,socket,tempfile,time
+import numpy as np
+#
+############################
+# Message Format
+############################
+#
+message_dtype = np.dtype([('sensor_id','<u2'),('seq','<u4'),('timestamp','<f8'),
+                          ('distance','<f4'),('strength','<u2'),
+                          ('temperature','<f4')]) # 24 bytes per frame, packed
+SUBSCRIBE = b'SUB' # datagram a subscriber sends to (re-)register
+UNSUBSCRIBE = b'UNSUB'
+MAX_DATAGRAM = {socket.AF_UNIX:65536,socket.AF_INET:1400} # bytes per datagram
+
+def pack_messages(frames,sensor_id=0,seq=0,timestamp=None):
+    ##########################
+    # (distance,strength,temperature) tuples -> message_dtype array;
+    # timestamp [s since epoch] is one value or one per frame
+    msgs = np.zeros(len(frames),dtype=message_dtype)
+    if len(frames)==0:
+        return msgs
+    cols = np.array(frames,dtype=float).reshape(len(frames),-1)
+    msgs['sensor_id'] = sensor_id
+    msgs['seq'] = (seq+np.arange(len(frames))) & 0xffffffff
+    msgs['timestamp'] = time.time() if timestamp is None else timestamp
+    msgs['distance'] = cols[:,0]
+    msgs['strength'] = cols[:,1]
+    msgs['temperature'] = cols[:,2]
+    return msgs
+
+def unpack_messages(data):
+    ##########################
+    # received bytes -> message_dtype array (copy-free view)
+    n = len(data)//message_dtype.itemsize
+    return np.frombuffer(data,dtype=message_dtype,count=n)
+
+def socket_family(address):
+    ##########################
+    # a path is a Unix domain socket, (host,port) is UDP
+    return socket.AF_UNIX if isinstance(address,str) else socket.AF_INET
+#
+############################
+# Datagram Publisher
+############################
+#
+class DatagramPublisher:
+    ##########################
+    # subscribers register by sending SUBSCRIBE to the publisher address;
+    # every publish() sends the batch to all of them and drops the ones
+    # that have gone away
+    def __init__(self,address,sensor_id=0):
+        self.address = address
+        self.family = socket_family(address)
+        self.sock = socket.socket(self.family,socket.SOCK_DGRAM)
+        if self.family==socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address) # stale socket file from a previous run
+        self.sock.bind(address)
+        self.sock.setblocking(False)
+        self.sensor_id = sensor_id
+        self.seq = 0 # sequence number of the next message
+        self.subscribers = set()
+        self.batch_max = MAX_DATAGRAM[self.family]//message_dtype.itemsize
+
+    def poll_subscribers(self):
+        ##########################
+        # handle pending (un)subscribe requests, never blocks
+        while True:
+            try:
+                data,addr = self.sock.recvfrom(64)
+            except (BlockingIOError,InterruptedError):
+                return
+            if data==SUBSCRIBE and addr:
+                self.subscribers.add(addr)
+            elif data==UNSUBSCRIBE:
+                self.subscribers.discard(addr)
+
+    def publish(self,frames,timestamp=None):
+        ##########################
+        # send frames (list of tuples) to every subscriber, batched into as
+        # few datagrams as fit (timestamp as in pack_messages); returns
+        # the number of datagrams sent
+        self.poll_subscribers()
+        msgs = pack_messages(frames,self.sensor_id,self.seq,timestamp)
+        self.seq = (self.seq+len(msgs)) & 0xffffffff
+        n_sent = 0
+        for start in range(0,len(msgs),self.batch_max):
+            data = msgs[start:start+self.batch_max].tobytes()
+            for addr in list(self.subscribers):
+                try:
+                    self.sock.sendto(data,addr)
+                    n_sent += 1
+                except (ConnectionRefusedError,FileNotFoundError):
+                    self.subscribers.discard(addr) # subscriber is gone
+                except BlockingIOError:
+                    pass # subscriber is not keeping up, drop this batch for it
+        return n_sent
+
+    def close(self):
+        self.sock.close()
+        if self.family==socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+class DatagramSubscriber:
+    ##########################
+    # receive() returns message_dtype arrays; the subscription is renewed
+    # whenever nothing arrives for resubscribe seconds (publisher restarts)
+    def __init__(self,publisher_address,address=None,resubscribe=1.0):
+        self.publisher_address = publisher_address
+        self.family = socket_family(publisher_address)
+        self.sock = socket.socket(self.family,socket.SOCK_DGRAM)
+        self.tmpdir = None # directory created for the socket (removed by close())
+        if self.family==socket.AF_UNIX:
+            if address is None:
+                self.tmpdir = tempfile.mkdtemp(prefix='tfluna-sub-')
+                address = os.path.join(self.tmpdir,'sock')
+            self.sock.bind(address)
+        else:
+            self.sock.bind(address or ('',0)) # any free port
+        self.address = self.sock.getsockname()
+        self.resubscribe = resubscribe
+        self.t_subscribed = 0.0
+        self.subscribe()
+
+    def subscribe(self):
+        try:
+            self.sock.sendto(SUBSCRIBE,self.publisher_address)
+        except (ConnectionRefusedError,FileNotFoundError):
+            pass # publisher not up yet, retried later
+        self.t_subscribed = time.monotonic()
+
+    def receive(self,timeout=None):
+        ##########################
+        # next batch of messages (empty array on timeout)
+        t_end = None if timeout is None else time.monotonic()+timeout
+        while True:
+            wait = self.resubscribe
+            if t_end is not None:
+                wait = min(wait,max(t_end-time.monotonic(),0.0))
+            self.sock.settimeout(wait)
+            try:
+                data = self.sock.recv(65536)
+                return unpack_messages(data)
+            except socket.timeout:
+                pass
+            if time.monotonic()-self.t_subscribed>=self.resubscribe:
+                self.subscribe()
+            if t_end is not None and time.monotonic()>=t_end:
+                return np.empty(0,dtype=message_dtype)
+
+    def close(self):
+        try:
+            self.sock.sendto(UNSUBSCRIBE,self.publisher_address)
+        except OSError:
+            pass
+        self.sock.close()
+        if self.family==socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        if self.tmpdir is not None:
+            os.rmdir(self.tmpdir) # only our own, never the caller's directory
+            self.tmpdir = None
+#
+############################
+# Shared Memory Ring
+############################
+#
+SHM_HEADER = 64 # bytes before the records (counters at offsets 0, 8 and 16)
+published_blocks = set() # shared memory names created by this process
+
+class SharedMemoryPublisher:
+    ##########################
+    # single writer ring of message_dtype records in a named shared memory
+    # block; readers attach by name and copy what is new. Like a seqlock,
+    # `claimed` is raised before records are overwritten and `count` only
+    # after they are complete, so a reader can tell which slots it copied
+    # may have been torn.
+    def __init__(self,name,size=4096,sensor_id=0):
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory(name=name,create=True,
+                                              size=SHM_HEADER+size*message_dtype.itemsize)
+        published_blocks.add(self.shm._name)
+        self.count = np.ndarray((1,),dtype='<u8',buffer=self.shm.buf) # records written
+        self.count[0] = 0
+        self.size_field = np.ndarray((1,),dtype='<u8',buffer=self.shm.buf,offset=8)
+        self.size_field[0] = size # ring capacity, read by subscribers
+        self.claimed = np.ndarray((1,),dtype='<u8',buffer=self.shm.buf,offset=16)
+        self.claimed[0] = 0 # records written once the write in progress is done
+        self.records = np.ndarray((size,),dtype=message_dtype,buffer=self.shm.buf,
+                                  offset=SHM_HEADER)
+        self.size = size
+        self.sensor_id = sensor_id
+
+    def publish(self,frames,timestamp=None):
+        msgs = pack_messages(frames,self.sensor_id,int(self.count[0]),timestamp)
+        if len(msgs)>self.size:
+            msgs = msgs[-self.size:]
+        count = int(self.count[0])
+        skip = len(frames)-len(msgs) # frames that would be overwritten at once
+        indx = (count+skip+np.arange(len(msgs))) % self.size
+        self.claimed[0] = count+len(frames) # slots below claimed-size may be torn from here
+        self.records[indx] = msgs
+        self.count[0] = count+len(frames) # publish after the data is in place
+        return len(msgs)
+
+    def close(self):
+        del self.count,self.size_field,self.claimed,self.records # release buffer exports
+        published_blocks.discard(self.shm._name)
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedMemorySubscriber:
+    ##########################
+    # read_new() returns the records written since the last call and
+    # counts the ones that were overwritten before they could be read
+    def __init__(self,name):
+        from multiprocessing import resource_tracker,shared_memory
+        self.shm = shared_memory.SharedMemory(name=name)
+        if self.shm._name not in published_blocks: # same process: the publisher unregisters it
+            try: # the publisher owns the block, don't let this process unlink it at exit
+                resource_tracker.unregister(self.shm._name,'shared_memory')
+            except Exception:
+                pass
+        self.count = np.ndarray((1,),dtype='<u8',buffer=self.shm.buf)
+        self.size = int(np.ndarray((1,),dtype='<u8',buffer=self.shm.buf,offset=8)[0])
+        self.claimed = np.ndarray((1,),dtype='<u8',buffer=self.shm.buf,offset=16)
+        self.records = np.ndarray((self.size,),dtype=message_dtype,buffer=self.shm.buf,
+                                  offset=SHM_HEADER)
+        self.next = int(self.count[0]) # start with new data only
+        self.lost = 0 # records overwritten before they were read
+
+    def read_new(self):
+        count = int(self.count[0])
+        if count-self.next>self.size:
+            self.lost += count-self.next-self.size
+            self.next = count-self.size
+        indx = np.arange(self.next,count) % self.size
+        out = self.records[indx] # copy (fancy indexing)
+        overrun = int(self.claimed[0])-self.size-self.next # slots the writer reached while copying
+        if overrun>0: # those may be torn, drop them
+            overrun = min(overrun,len(out))
+            out = out[overrun:]
+            self.lost += overrun
+        self.next = count
+        return out
+
+    def close(self):
+        del self.count,self.claimed,self.records
+        self.shm.close()
+#
+############################
+# Reader Loop
+############################
+#
+def run_publisher(lidar,publishers,stop_event=None):
+    ##########################
+    # read every frame from an open TFLuna and fan it out to all
+    # publishers (each read_many() batch becomes one publish call),
+    # stamped with the per-frame arrival times on the epoch clock
+    wall_offset = time.time()-time.monotonic() # monotonic -> epoch [s]
+    while stop_event is None or not stop_event.is_set():
+        stamped = lidar.read_many(stamped=True)
+        if stamped:
+            timestamps = [t_ns*1e-9+wall_offset for t_ns,_,_,_ in stamped]
+            frames = [frame[1:] for frame in stamped]
+            for publisher in publishers:
+                publisher.publish(frames,timestamps)
@@ -0,0 +1,144 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- append-only binary recordings (fixed 64-byte
+# --- header + packed frame_dtype records) and
+# --- memory-mapped replay as a NumPy structured array
+#
+#
+######################################################
+#
+import os,struct,time
+import numpy as np
+from tfluna_decoder import frame_dtype
+#
+############################
+# File Format
+############################
+#
+REC_MAGIC = b'TFLUNA\x00\x00' # file signature
+REC_VERSION = 1 # format version
+HEADER_SIZE = 64 # bytes, records start right after the header
+header_struct = struct.Struct('<8sHHdd') # magic, version, record size, samp_rate, start time
+
+def pack_header(samp_rate=0.0,start_time=None):
+    ##########################
+    # 64-byte file header (zero padded)
+    if start_time is None:
+        start_time = time.time()
+    header = header_struct.pack(REC_MAGIC,REC_VERSION,frame_dtype.itemsize,
+                                float(samp_rate),start_time)
+    return header.ljust(HEADER_SIZE,b'\x00')
+
+def read_header(path):
+    ##########################
+    # header fields as a dict, raises ValueError if not a recording
+    with open(path,'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header)<HEADER_SIZE or header[:len(REC_MAGIC)]!=REC_MAGIC:
+        raise ValueError('{0} is not a TF-Luna recording'.format(path))
+    magic,version,record_size,samp_rate,start_time = header_struct.unpack_from(header)
+    if version!=REC_VERSION or record_size!=frame_dtype.itemsize:
+        raise ValueError('Unsupported recording format in {0}'.format(path))
+    return {'version':version,'record_size':record_size,
+            'samp_rate':samp_rate,'start_time':start_time}
+#
+############################
+# Recorder
+############################
+#
+class Recorder:
+    ##########################
+    # appends records through a fixed-size chunk buffer, so memory use is
+    # constant however long the capture runs; the file is fsync'd at most
+    # every fsync_interval seconds. Re-opening an existing file continues
+    # it (a partial record left by a crash is cut off first).
+    def __init__(self,path,samp_rate=0.0,chunk_size=1024,fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval # [s]
+        if os.path.exists(path) and os.path.getsize(path)>0:
+            read_header(path) # validate before appending
+            size = os.path.getsize(path)
+            whole = HEADER_SIZE+((size-HEADER_SIZE)//frame_dtype.itemsize)*frame_dtype.itemsize
+            if whole!=size:
+                os.truncate(path,whole) # drop a torn trailing record
+            self.file = open(path,'ab')
+        else:
+            self.file = open(path,'ab')
+            self.file.write(pack_header(samp_rate))
+        self.chunk = np.empty(chunk_size,dtype=frame_dtype) # preallocated write buffer
+        self.n_chunk = 0 # records waiting in the chunk
+        self.n_records = 0 # records written by this recorder
+        self.t_sync = time.monotonic() # last fsync
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc_info):
+        self.close()
+
+    def append(self,distance,strength,temperature,timestamp):
+        ##########################
+        # add one record; the chunk is written out when it is full or
+        # fsync_interval has passed, so a slow capture still reaches the disk
+        record = self.chunk[self.n_chunk]
+        record['distance'] = distance
+        record['strength'] = strength
+        record['temperature'] = temperature
+        record['timestamp'] = timestamp
+        self.n_chunk += 1
+        self.n_records += 1
+        if self.n_chunk==len(self.chunk) or time.monotonic()-self.t_sync>=self.fsync_interval:
+            self.flush() # also syncs once the interval has passed
+
+    def extend(self,records):
+        ##########################
+        # add a structured array of records (e.g. from decode_frames)
+        self.flush()
+        self.file.write(np.ascontiguousarray(records,dtype=frame_dtype).tobytes())
+        self.n_records += len(records)
+        self._maybe_sync()
+
+    def flush(self):
+        ##########################
+        # write the chunk buffer to the file
+        if self.n_chunk:
+            self.file.write(self.chunk[:self.n_chunk].tobytes())
+            self.n_chunk = 0
+        self._maybe_sync()
+
+    def _maybe_sync(self):
+        if time.monotonic()-self.t_sync>=self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        ##########################
+        # force everything written so far onto the disk
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.t_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.sync()
+            self.file.close()
+#
+############################
+# Replay
+############################
+#
+def load_recording(path):
+    ##########################
+    # (header dict, read-only memory-mapped structured array); nothing is
+    # read until it is indexed, so hours of data open instantly
+    header = read_header(path)
+    n_records = (os.path.getsize(path)-HEADER_SIZE)//frame_dtype.itemsize
+    if n_records==0:
+        return header,np.empty(0,dtype=frame_dtype)
+    records = np.memmap(path,dtype=frame_dtype,mode='r',offset=HEADER_SIZE,
+                        shape=(n_records,)) # ignores a torn trailing record
+    return header,records
@@ -0,0 +1,76 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- preallocated NumPy ring buffer for distance,
+# --- strength, temperature and timestamp
+#
+#
+######################################################
+#
+import numpy as np
+from tfluna_decoder import frame_dtype
+#
+############################
+# Ring Buffer
+############################
+#
+class RingBuffer:
+    ##########################
+    # single-producer/single-consumer ring buffer, one column per field.
+    # every sample is written twice (at i and i+size) so the newest n
+    # samples are always one contiguous slice: latest() returns views,
+    # never copies. The producer only writes the columns and then bumps
+    # self.count, so a consumer in another thread needs no lock. Give the
+    # ring some headroom over the largest window read from it, the oldest
+    # sample of a full-size view may be overwritten while it is in use.
+    def __init__(self,size,dtype=frame_dtype):
+        self.size = size # capacity in samples
+        self.names = dtype.names # field names (distance,strength,...)
+        self.columns = {name:np.zeros(2*size,dtype=dtype[name]) for name in self.names}
+        self.count = 0 # total samples written (only the producer changes it)
+
+    def append(self,distance,strength,temperature,timestamp):
+        ##########################
+        # write one sample (producer side)
+        indx = self.count % self.size
+        cols = self.columns
+        for name,value in zip(self.names,(distance,strength,temperature,timestamp)):
+            col = cols[name]
+            col[indx] = value
+            col[indx+self.size] = value # mirror
+        self.count += 1 # publish after the data is in place
+
+    def extend(self,records):
+        ##########################
+        # write a structured array of samples (e.g. from decode_frames)
+        n = len(records)
+        if n == 0:
+            return
+        if n > self.size:
+            skip = n-self.size # older samples would be overwritten anyway
+            records = records[skip:]
+        else:
+            skip = 0
+        indx = (self.count+skip+np.arange(len(records))) % self.size
+        for name in self.names:
+            col = self.columns[name]
+            col[indx] = records[name]
+            col[indx+self.size] = records[name] # mirror
+        self.count += n
+
+    def __len__(self):
+        return min(self.count,self.size) # samples currently held
+
+    def latest(self,name,n=None,count=None):
+        ##########################
+        # zero-copy view of the newest n samples of one field, oldest first;
+        # pass the same count (a snapshot of self.count) to read several
+        # fields of the same samples
+        if count is None:
+            count = self.count # read once, the producer may move on
+        n = min(count,self.size) if n is None else min(n,count,self.size)
+        end = count % self.size + self.size
+        return self.columns[name][end-n:end]
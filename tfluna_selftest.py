@@ -0,0 +1,235 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- self-check against the simulated sensor (pty):
+# --- decoder, commands, baud rate detection, the
+# --- sensor array and publish/subscribe
+# --- (no hardware needed, Linux/macOS only)
+#
+#
+######################################################
+#
+# python3 tfluna_selftest.py      (or: python3 -m unittest tfluna_selftest)
+#
+import os,tempfile,time,unittest
+from tfluna_decoder import FrameDecoder
+from tfluna_commands import build_command,CMD_SAMPLE_RATE
+from tfluna_driver import TFLuna
+from tfluna_multi import SensorArray
+from tfluna_pubsub import DatagramPublisher,DatagramSubscriber,SharedMemoryPublisher,\
+     SharedMemorySubscriber
+from tfluna_sim import SimulatedTFLuna,make_frame
+#
+############################
+# Decoder
+############################
+#
+class DecoderTest(unittest.TestCase):
+    def test_split_frames(self):
+        ##########################
+        # frames fed one byte at a time come out whole
+        decoder = FrameDecoder()
+        frames = []
+        for byte in make_frame(1.23,500,40.0)*3:
+            frames += decoder.feed(bytes([byte]))
+        self.assertEqual(frames,[(1.23,500,40.0)]*3)
+        self.assertEqual(decoder.checksum_errors+decoder.bytes_discarded,0)
+
+    def test_resync(self):
+        ##########################
+        # junk and a bad checksum are skipped, later frames still decode
+        frame = make_frame(2.0,1000,35.0)
+        bad = frame[:-1]+bytes([(frame[-1]+1) & 0xff])
+        decoder = FrameDecoder()
+        frames = decoder.feed(b'\x00\x59\x13'+bad+frame+frame[3:]+frame)
+        self.assertEqual(frames,[(2.0,1000,35.0)]*2)
+        self.assertGreater(decoder.checksum_errors+decoder.bytes_discarded,0)
+
+    def test_stray_response_header(self):
+        ##########################
+        # a 0x5a inside a frame (strength 0x3c5a) never holds frames back,
+        # with or without a command waiting for its response
+        frame = make_frame(1.0,0x3c5a,35.0)
+        for accept_responses in (False,True):
+            decoder = FrameDecoder()
+            decoder.accept_responses = accept_responses
+            self.assertEqual(decoder.feed(frame[5:]+frame),[(1.0,0x3c5a,35.0)])
+            self.assertLessEqual(decoder.bytes_needed(),len(frame))
+
+    def test_response(self):
+        ##########################
+        # responses are picked out of the stream while a command waits
+        frame = make_frame(1.0,100,35.0)
+        response = build_command(CMD_SAMPLE_RATE,b'\x64\x00')
+        decoder = FrameDecoder()
+        decoder.accept_responses = True
+        frames = decoder.feed(frame+response[:3])+decoder.feed(response[3:]+frame)
+        self.assertEqual(len(frames),2)
+        self.assertEqual(list(decoder.responses),[response])
+#
+############################
+# Commands (simulated sensor)
+############################
+#
+class CommandTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = SimulatedTFLuna(samp_rate=100,baudrate=115200,enforce_baudrate=True).start()
+        self.lidar = TFLuna(self.sim.port,115200).open()
+
+    def tearDown(self):
+        self.lidar.close()
+        self.sim.stop()
+
+    def test_read(self):
+        frame = self.lidar.read()
+        self.assertIsNotNone(frame)
+        self.assertAlmostEqual(frame[0],1.5,delta=0.51) # default profile: 1.0-2.0 m
+
+    def test_sample_rate(self):
+        self.assertEqual(self.lidar.set_sample_rate(250),250)
+        self.assertEqual(self.sim.samp_rate,250)
+        self.assertEqual(self.lidar.version(),self.sim.version)
+
+    def test_baudrate(self):
+        ##########################
+        # every step up must be confirmed at the new rate
+        for baudrate in (230400,460800,921600):
+            self.assertEqual(self.lidar.set_baudrate(baudrate),baudrate)
+            self.assertEqual(self.sim.baudrate,baudrate)
+            self.assertIsNotNone(self.lidar.read())
+
+    def test_wrong_baudrate(self):
+        ##########################
+        # commands sent at the wrong rate are not understood
+        self.lidar.ser.baudrate = 57600
+        time.sleep(0.1)
+        self.assertIsNone(self.lidar.set_sample_rate(10))
+        self.assertEqual(self.sim.samp_rate,100)
+#
+############################
+# Baud Rate Detection
+############################
+#
+class DetectTest(unittest.TestCase):
+    def test_detect(self):
+        for baudrate in (9600,115200,460800):
+            with SimulatedTFLuna(samp_rate=100,baudrate=baudrate,enforce_baudrate=True) as sim:
+                with TFLuna(sim.port) as lidar:
+                    self.assertEqual(lidar.detect_baudrate(),baudrate)
+                    self.assertIsNotNone(lidar.read())
+
+    def test_detect_trigger_mode(self):
+        ##########################
+        # no frames to listen for: found by the version response
+        with SimulatedTFLuna(samp_rate=0,baudrate=230400,enforce_baudrate=True) as sim:
+            with TFLuna(sim.port) as lidar:
+                self.assertEqual(lidar.detect_baudrate(),230400)
+#
+############################
+# Sensor Array
+############################
+#
+class SensorArrayTest(unittest.TestCase):
+    def test_merged_order(self):
+        ##########################
+        # two sensors with smoothed (frame clock) times: one stream in
+        # time order, every frame of both sensors in it
+        sims = [SimulatedTFLuna(samp_rate=250).start() for _ in range(2)]
+        try:
+            with SensorArray({ii:sim.port for ii,sim in enumerate(sims)}) as array:
+                for lidar in array.sensors.values():
+                    self.assertEqual(lidar.set_sample_rate(250),250)
+                stamps,counts = [],[0,0]
+                t_end = time.monotonic()+1.0
+                for timestamp,sensor_id,distance,strength,temperature in array.frames(timeout=0.5):
+                    stamps.append(timestamp)
+                    counts[sensor_id] += 1
+                    if time.monotonic()>t_end:
+                        break
+        finally:
+            for sim in sims:
+                sim.stop()
+        self.assertEqual(stamps,sorted(stamps))
+        self.assertGreater(min(counts),200)
+#
+############################
+# Publish/Subscribe
+############################
+#
+class PubSubTest(unittest.TestCase):
+    frames = [(0.01*ii,100+ii,35.0) for ii in range(10)]
+
+    def round_trip(self,publisher,subscriber):
+        ##########################
+        # publish until the subscription has arrived, return what came back
+        for _ in range(50):
+            if publisher.publish(self.frames,1234.5):
+                break
+            time.sleep(0.01)
+        return subscriber.receive(timeout=1.0)
+
+    def test_unix(self):
+        ##########################
+        # caller-chosen subscriber socket: close() leaves its directory alone
+        with tempfile.TemporaryDirectory() as tmpdir:
+            publisher = DatagramPublisher(os.path.join(tmpdir,'pub.sock'),sensor_id=3)
+            sub_path = os.path.join(tmpdir,'sub.sock')
+            subscriber = DatagramSubscriber(publisher.address,sub_path)
+            try:
+                msgs = self.round_trip(publisher,subscriber)
+            finally:
+                subscriber.close()
+                publisher.close()
+            self.assertEqual(list(msgs['seq']),list(range(10)))
+            self.assertTrue((msgs['sensor_id']==3).all())
+            self.assertAlmostEqual(float(msgs['distance'][5]),0.05,places=6)
+            self.assertFalse(os.path.exists(sub_path))
+            self.assertTrue(os.path.isdir(tmpdir))
+
+    def test_unix_tmpdir(self):
+        ##########################
+        # default subscriber socket: its temporary directory is removed
+        with tempfile.TemporaryDirectory() as tmpdir:
+            publisher = DatagramPublisher(os.path.join(tmpdir,'pub.sock'))
+            subscriber = DatagramSubscriber(publisher.address)
+            sub_dir = subscriber.tmpdir
+            try:
+                self.assertEqual(len(self.round_trip(publisher,subscriber)),10)
+            finally:
+                subscriber.close()
+                publisher.close()
+            self.assertFalse(os.path.exists(sub_dir))
+
+    def test_udp(self):
+        publisher = DatagramPublisher(('127.0.0.1',0))
+        subscriber = DatagramSubscriber(publisher.sock.getsockname())
+        try:
+            msgs = self.round_trip(publisher,subscriber)
+        finally:
+            subscriber.close()
+            publisher.close()
+        self.assertEqual(list(msgs['strength']),[frame[1] for frame in self.frames])
+        self.assertTrue((msgs['timestamp']==1234.5).all())
+
+    def test_shared_memory_overrun(self):
+        ##########################
+        # records overwritten before read_new() are counted, not returned
+        publisher = SharedMemoryPublisher('tfluna-selftest-{0}'.format(os.getpid()),size=64)
+        subscriber = SharedMemorySubscriber(publisher.shm.name)
+        try:
+            publisher.publish(self.frames)
+            self.assertEqual(list(subscriber.read_new()['seq']),list(range(10)))
+            publisher.publish([(1.0,1,35.0)]*200)
+            msgs = subscriber.read_new()
+        finally:
+            subscriber.close()
+            publisher.close()
+        self.assertEqual(len(msgs),64)
+        self.assertEqual(subscriber.lost,200-64)
+        self.assertEqual(list(msgs['seq']),list(range(210-64,210)))
+#
+if __name__ == '__main__':
+    unittest.main()
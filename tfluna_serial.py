@@ -0,0 +1,63 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# TF-Luna Mini LiDAR wired to a Raspberry Pi via UART
+# --- blocking serial helpers (no busy-polling of
+# --- ser.in_waiting)
+#
+#
+######################################################
+import select
+#
+############################
+# Serial Settings
+############################
+#
+READ_TIMEOUT = 1.0 # [s] blocking read timeout (ports must not use timeout=0)
+SERIAL_BUFFER_SIZE = 4095 # Linux tty input buffer, a full buffer means lost bytes
+#
+############################
+# Blocking Reads
+############################
+#
+def read_frames(ser,decoder):
+    ##########################
+    # sleep until enough bytes for a full frame have arrived (or the port
+    # timeout expires), then decode everything waiting on the port
+    data = ser.read(decoder.bytes_needed()) # blocks, no CPU while idle
+    if data:
+        counter = ser.in_waiting # grab any frames queued behind it
+        if counter > 0:
+            if counter >= SERIAL_BUFFER_SIZE:
+                decoder.buffer_overruns += 1 # the kernel had to drop input
+            data += ser.read(counter)
+    return decoder.feed(data) # empty list on timeout
+
+def wait_readable(ser,timeout):
+    ##########################
+    # sleep until the port has data or the timeout [s] expires, without
+    # touching the port timeout (changing it re-configures the tty)
+    if ser.in_waiting > 0:
+        return True
+    readable,_,_ = select.select([ser.fileno()],[],[],max(timeout,0.0))
+    return bool(readable)
+
+def read_available(ser,decoder,timeout):
+    ##########################
+    # decode whatever arrives within timeout [s] (frames list, maybe empty)
+    if not wait_readable(ser,timeout):
+        return []
+    return read_waiting(ser,decoder)
+
+def read_waiting(ser,decoder):
+    ##########################
+    # decode whatever is already waiting on the port, never blocks
+    # (select/event loop callbacks)
+    counter = ser.in_waiting
+    if counter == 0:
+        return []
+    if counter >= SERIAL_BUFFER_SIZE:
+        decoder.buffer_overruns += 1 # the kernel had to drop input
+    return decoder.feed(ser.read(counter))
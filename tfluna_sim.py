@@ -0,0 +1,306 @@
+######################################################
+# Copyright (c) 2021 Maker Portal LLC
+# Author: Joshua Hrisko
+######################################################
+#
+# Simulated TF-Luna served over a pseudo-terminal
+# --- checksummed 0x59 frames at any sample rate,
+# --- answers the 0x5a commands, optional noise, byte
+# --- drops and misalignment (hardware-free testing)
+#
+#
+######################################################
+#
+import argparse,math,os,pty,random,select,struct,termios,threading,time,tty
+from collections import deque
+from tfluna_decoder import FRAME_LEN
+from tfluna_clock import BITS_PER_BYTE
+from tfluna_commands import build_command,CMD_FIRMWARE_VERSION,CMD_SOFT_RESET,\
+     CMD_SAMPLE_RATE,CMD_TRIGGER,CMD_BAUDRATE,CMD_OUTPUT_ENABLE,CMD_FACTORY_RESET,\
+     CMD_SAVE_SETTINGS,CMD_FULL_VERSION,CMD_LOW_POWER
+#
+############################
+# Simulator Settings
+############################
+#
+tty_speeds = {getattr(termios,'B{0}'.format(baud)):baud for baud in
+              [9600,19200,38400,57600,115200,230400,460800,921600]
+              if hasattr(termios,'B{0}'.format(baud))} # termios constant -> baud
+TX_BUFFER = 64 # [bytes] sensor output waiting for the line before frames are skipped
+
+def default_profile(t):
+    ##########################
+    # distance [m] at time t [s]: slow 0.5 m swing around 1.5 m
+    return 1.5+0.5*math.sin(2.0*math.pi*t/5.0)
+
+def make_frame(distance,strength,temperature):
+    ##########################
+    # 9-byte data frame with checksum (distance [m], temperature [C])
+    dist_cm = min(max(int(round(distance*100.0)),0),0xffff)
+    temp_raw = min(max(int(round((temperature+256.0)*8.0)),0),0xffff)
+    frame = bytearray(b'\x59\x59')
+    frame += struct.pack('<HHH',dist_cm,min(max(int(strength),0),0xffff),temp_raw)
+    frame.append(sum(frame) & 0xff)
+    return bytes(frame)
+#
+############################
+# Simulated Sensor
+############################
+#
+class SimulatedTFLuna:
+    ##########################
+    # usage:
+    #   sim = SimulatedTFLuna(samp_rate=250).start()
+    #   lidar = TFLuna(sim.port).open()
+    # with enforce_baudrate the host port must be set to the simulated
+    # rate (read back from the pty's termios), otherwise it gets garbage
+    # and its commands are ignored, like a real UART at the wrong speed.
+    # Output is paced at the simulated baud rate (a pty itself has no
+    # speed): bytes reach the host once the line could have carried them.
+    def __init__(self,samp_rate=100,baudrate=115200,profile=default_profile,
+                 noise=0.0,strength=1000,temperature=35.0,drop_rate=0.0,
+                 junk_rate=0.0,misalign=False,enforce_baudrate=False,
+                 version='TF-Luna-sim V1.0.0',seed=None):
+        self.samp_rate = samp_rate # [Hz] 0 = trigger mode
+        self.baudrate = baudrate # simulated sensor baudrate
+        self.profile = profile # distance [m] as a function of time [s]
+        self.noise = noise # std. dev. of distance noise [m]
+        self.strength = strength # signal strength
+        self.temperature = temperature # chip temperature [C]
+        self.drop_rate = drop_rate # probability of dropping a byte from a frame
+        self.junk_rate = junk_rate # probability of junk bytes before a frame
+        self.misalign = misalign # start the stream in the middle of a frame
+        self.enforce_baudrate = enforce_baudrate
+        self.version = version
+        self.output_enabled = True
+        self.rng = random.Random(seed)
+        self.frames_sent = 0 # frames handed to the pty
+        self.frames_lost = 0 # frames dropped because the host did not read
+        self.frames_skipped = 0 # frames the line had no time for (baud rate too low)
+        self.tx_queue = deque() # (arrival time,bytes,frames,baudrate) paced by the baud rate
+        self.t_line = 0.0 # time the line finishes the queued bytes
+        self.master = self.slave = None
+        self.port = None # device path for the host side
+        self.t0 = time.monotonic() # simulation start time
+        self.speeds = set() # host speeds seen since the last read (run())
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        ##########################
+        # create the pty pair and start the sensor thread
+        self.master,self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master,False) # never stall on a host that stopped reading
+        self.port = os.ttyname(self.slave)
+        self.speeds = self.host_speeds() # before the host opens the port
+        self.tx_queue.clear()
+        self.t_line = 0.0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run,daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for fd in (self.master,self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*exc_info):
+        self.stop()
+
+    def host_baudrate(self):
+        ##########################
+        # speed the host configured on its side of the pty
+        return tty_speeds.get(termios.tcgetattr(self.slave)[5])
+
+    def host_speeds(self):
+        ##########################
+        # host speed sample for command_ok() (empty set when the baud
+        # rate is not enforced)
+        return {self.host_baudrate()} if self.enforce_baudrate else set()
+
+    def command_ok(self,speeds):
+        ##########################
+        # True if bytes read now were written at the simulated rate, given
+        # the host speeds seen since the previous read. A pty only shows
+        # the speed at read time, so if the host switched in between (e.g.
+        # set_baudrate() writes at the old rate, then reconfigures before
+        # this thread runs) the write-time speed is unknown: accept.
+        return not self.enforce_baudrate or len(speeds)>1 or self.baudrate in speeds
+
+    ############################
+    # Output
+    ############################
+    #
+    def next_frame(self,t):
+        ##########################
+        # frame bytes for time t, with the configured impairments
+        distance = self.profile(t)
+        if self.noise:
+            distance += self.rng.gauss(0.0,self.noise)
+        frame = make_frame(distance,self.strength,self.temperature)
+        if self.drop_rate and self.rng.random()<self.drop_rate:
+            indx = self.rng.randrange(FRAME_LEN)
+            frame = frame[:indx]+frame[indx+1:] # lost byte
+        if self.junk_rate and self.rng.random()<self.junk_rate:
+            junk = bytes(self.rng.randrange(256) for _ in range(self.rng.randint(1,FRAME_LEN)))
+            frame = junk+frame # misaligns the stream
+        return frame
+
+    def send(self,data,n_frames=0):
+        ##########################
+        # queue bytes for the host at the current baud rate, they arrive
+        # once the line has carried them (transmit()). False if more than
+        # TX_BUFFER bytes are still waiting (skipped)
+        now = time.monotonic()
+        byte_time = BITS_PER_BYTE/self.baudrate # [s]
+        t_start = max(now,self.t_line)
+        if (t_start-now)/byte_time>TX_BUFFER:
+            return False
+        self.t_line = t_start+len(data)*byte_time
+        self.tx_queue.append((self.t_line,data,n_frames,self.baudrate))
+        return True
+
+    def transmit(self):
+        ##########################
+        # hand the bytes that have crossed the line to the pty, garbled if
+        # the host is not at the rate they were sent at; returns the time
+        # the next ones are due (None if nothing is queued)
+        now = time.monotonic()
+        while self.tx_queue and self.tx_queue[0][0]<=now:
+            t_due,data,n_frames,baudrate = self.tx_queue.popleft()
+            if self.enforce_baudrate and self.host_baudrate()!=baudrate:
+                data = bytes(self.rng.randrange(256) for _ in data)
+            try:
+                os.write(self.master,data)
+                self.frames_sent += n_frames
+            except BlockingIOError:
+                self.frames_lost += n_frames # host input buffer full (overrun)
+        return self.tx_queue[0][0] if self.tx_queue else None
+
+    ############################
+    # Commands
+    ############################
+    #
+    def handle_command(self,packet):
+        ##########################
+        # answer one checksummed 0x5a command packet
+        cmd_id,payload = packet[2],packet[3:-1]
+        if cmd_id==CMD_FIRMWARE_VERSION:
+            self.send(build_command(cmd_id,bytes([0,0,1]))) # V1.0.0
+        elif cmd_id in (CMD_SOFT_RESET,CMD_FACTORY_RESET,CMD_SAVE_SETTINGS):
+            self.send(build_command(cmd_id,b'\x00')) # success
+        elif cmd_id==CMD_SAMPLE_RATE:
+            self.samp_rate = int.from_bytes(payload[:2],'little')
+            self.send(packet)
+        elif cmd_id==CMD_TRIGGER:
+            if not self.send(self.next_frame(time.monotonic()-self.t0),1):
+                self.frames_skipped += 1
+        elif cmd_id==CMD_BAUDRATE:
+            self.send(packet) # echo at the old rate...
+            self.baudrate = int.from_bytes(payload[:4],'little') # ...then switch
+        elif cmd_id==CMD_OUTPUT_ENABLE:
+            self.output_enabled = bool(payload[:1]==b'\x01')
+            self.send(packet)
+        elif cmd_id==CMD_FULL_VERSION:
+            self.send(build_command(cmd_id,self.version.encode('utf-8')[:26].ljust(26,b'\x00')))
+        elif cmd_id==CMD_LOW_POWER:
+            if payload[:1]!=b'\x00':
+                self.samp_rate = payload[0]
+            self.send(packet)
+        else:
+            self.send(packet) # format, amp threshold, ...: echo
+
+    def parse_commands(self,buf):
+        ##########################
+        # pull complete, checksummed command packets out of buf
+        while buf:
+            indx = buf.find(0x5a)
+            if indx<0:
+                buf.clear()
+                return
+            del buf[:indx]
+            if len(buf)<2 or len(buf)<buf[1]:
+                return # wait for the rest
+            length = buf[1]
+            packet = bytes(buf[:length])
+            if length>=4 and (sum(packet[:-1]) & 0xff)==packet[-1]:
+                del buf[:length]
+                self.handle_command(packet)
+            else:
+                del buf[:1] # not a command, re-sync
+
+    ############################
+    # Sensor Loop
+    ############################
+    #
+    def run(self):
+        self.t0 = time.monotonic()
+        t_next = self.t0
+        cmd_buf = bytearray()
+        if self.misalign:
+            self.send(make_frame(1.0,self.strength,self.temperature)[4:]) # half a frame
+        while not self.stop_event.is_set():
+            rate = self.samp_rate if self.output_enabled else 0
+            if rate>0:
+                now = time.monotonic()
+                if now>=t_next:
+                    # catch up in one write if the thread was descheduled
+                    n = min(int((now-t_next)*rate)+1,1000)
+                    data = b''.join(self.next_frame(t_next-self.t0+ii/rate) for ii in range(n))
+                    if not self.send(data,n):
+                        self.frames_skipped += n
+                    t_next += n/rate
+                wait = max(t_next-time.monotonic(),0.0)
+            else:
+                t_next = time.monotonic()
+                wait = 0.05
+            t_due = self.transmit()
+            if t_due is not None:
+                wait = min(wait,max(t_due-time.monotonic(),0.0))
+            self.speeds |= self.host_speeds()
+            readable,_,_ = select.select([self.master],[],[],min(wait,0.05))
+            if not readable and self.enforce_baudrate:
+                speeds = self.host_speeds()
+                if not select.select([self.master],[],[],0)[0]:
+                    self.speeds = speeds # nothing pending: later bytes are written at or after this
+            if readable:
+                try:
+                    data = os.read(self.master,1024)
+                except (BlockingIOError,OSError):
+                    continue
+                if self.command_ok(self.speeds|self.host_speeds()):
+                    cmd_buf += data
+                    self.parse_commands(cmd_buf)
+                self.speeds = self.host_speeds()
+#
+############################
+# Stand-alone Simulator
+############################
+#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulated TF-Luna on a pseudo-terminal')
+    parser.add_argument('--rate',type=int,default=100,help='sample rate [Hz]')
+    parser.add_argument('--baud',type=int,default=115200,help='simulated baud rate')
+    parser.add_argument('--noise',type=float,default=0.0,help='distance noise std. dev. [m]')
+    parser.add_argument('--drop-rate',type=float,default=0.0,help='byte drop probability per frame')
+    parser.add_argument('--junk-rate',type=float,default=0.0,help='junk bytes probability per frame')
+    args = parser.parse_args()
+    sim = SimulatedTFLuna(samp_rate=args.rate,baudrate=args.baud,noise=args.noise,
+                          drop_rate=args.drop_rate,junk_rate=args.junk_rate).start()
+    print('Simulated TF-Luna on {0} (Ctrl+C to stop)'.format(sim.port))
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        sim.stop()